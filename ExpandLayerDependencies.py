@@ -46,16 +46,30 @@ from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
 import logging
 import os
-import re
-from typing import Dict, Iterable, List, Sequence, Tuple
+from itertools import islice
+from typing import FrozenSet, Iterable, Iterator, List, Sequence, Set
+
+import lineage_expand
+from lineage_expand import SOURCE_COLUMN, TARGET_COLUMN
+
+try:  # Optional: vectorised CSV parsing and Parquet/Feather I/O.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as pa_feather
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is not a hard dependency
+    pa = pc = pa_csv = pa_feather = pq = None
 
 LOGGER = logging.getLogger(__name__)
 
-TARGET_COLUMN = "Target Table"
-SOURCE_COLUMN = "Source Table"
-_LAYER_PATTERN = re.compile(r"^Layer\s+(\d+)$")
+# Rows per Arrow record batch when reading or writing Parquet/Feather.
+_CHUNK_SIZE = 10_000
+# Columnar formats handled through pyarrow instead of the csv module.
+_ARROW_SUFFIXES = (".parquet", ".feather")
 
 
 def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
@@ -76,141 +90,187 @@ def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
         required=True,
         help="Destination CSV that will include exploded layer rows",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Worker processes for the expansion pass; 0 uses every CPU (default: 1)",
+    )
     parser.add_argument(
         "--log-level",
         default="INFO",
         help="Logging level (default: INFO)",
     )
-    return parser.parse_args(argv)
-
+    args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 (every CPU) or a positive worker count")
+    return args
+
+
+def _read_csv(path: str) -> tuple[Iterator[List[str]], List[str]]:
+    """Return (rows, fieldnames) for ``path``.
+
+    Only the header is read eagerly.  ``rows`` is a lazy, single-use
+    iterator, so large inputs are never held in memory; a further pass needs
+    a fresh ``_iter_rows(path, len(fieldnames))``.  Rows are positional
+    lists aligned with ``fieldnames``; short rows are padded with ``""`` and
+    surplus cells are dropped.  ``.parquet``/``.feather`` paths are read
+    through pyarrow.
+    """
+
+    try:
+        if _is_arrow_path(path):
+            fieldnames = list(_read_arrow_schema(path).names)
+        else:
+            with open(path, "r", newline="", encoding="utf-8-sig") as handle:
+                fieldnames = next(csv.reader(handle), [])
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Input file not found: {path}") from None
+    return _iter_rows(path, len(fieldnames)), fieldnames
+
+
+def _iter_rows(path: str, width: int) -> Iterator[List[str]]:
+    """Yield the data rows of ``path`` (header skipped) as ``width``-cell lists."""
+
+    if _is_arrow_path(path):
+        yield from _iter_arrow_rows(path)
+        return
 
-def _read_csv(path: str) -> tuple[List[Dict[str, str]], List[str]]:
-    """Read ``path`` and return (rows, fieldnames)."""
+    yield from lineage_expand.iter_csv_rows(path, width, encoding="utf-8-sig")
 
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Input CSV not found: {path}")
 
-    with open(path, "r", newline="", encoding="utf-8-sig") as handle:
-        reader = csv.DictReader(handle)
-        fieldnames = reader.fieldnames[:] if reader.fieldnames else []
-        rows: List[Dict[str, str]] = [dict(row) for row in reader]
-    return rows, fieldnames
+def _is_arrow_path(path: str) -> bool:
+    """Return True when ``path`` names a Parquet or Feather file."""
 
+    return path.lower().endswith(_ARROW_SUFFIXES)
 
-def _write_csv(path: str, rows: Iterable[Dict[str, str]], fieldnames: Sequence[str]) -> None:
-    """Write ``rows`` to ``path`` preserving ``fieldnames`` order."""
 
-    os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
-    with open(path, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames, extrasaction="ignore")
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+def _require_pyarrow(path: str) -> None:
+    if pa is None:
+        raise ImportError(f"pyarrow is required to read or write {path}")
 
 
-def _normalise_value(value: str | None) -> str:
-    """Return a stripped string (``""`` for ``None``)."""
+def _read_arrow_schema(path: str) -> "pa.Schema":
+    """Return the column schema of a Parquet/Feather file without loading its rows."""
 
-    if value is None:
-        return ""
-    return value.strip()
+    _require_pyarrow(path)
+    if path.lower().endswith(".parquet"):
+        return pq.read_schema(path)
+    return pa_feather.read_table(path, memory_map=True).schema
 
 
-def _extract_layer_columns(fieldnames: Sequence[str]) -> List[str]:
-    """Return layer columns sorted numerically (Layer 1, Layer 2, ...)."""
+def _read_arrow_table(path: str, columns: Sequence[str] | None = None) -> "pa.Table":
+    """Load ``columns`` (default: all) of a Parquet/Feather file."""
 
-    layers = []
-    for name in fieldnames:
-        match = _LAYER_PATTERN.match(name)
-        if match:
-            layers.append((int(match.group(1)), name))
-    layers.sort(key=lambda item: item[0])
-    return [name for _, name in layers]
+    _require_pyarrow(path)
+    if path.lower().endswith(".parquet"):
+        return pq.read_table(path, columns=columns)
+    return pa_feather.read_table(path, columns=columns, memory_map=True)
 
 
-def expand_rows(rows: Sequence[Dict[str, str]], layer_columns: Sequence[str]) -> List[Dict[str, str]]:
-    """Return rows plus new rows for each intermediate layer table, grouped by target table."""
+def _iter_arrow_rows(path: str) -> Iterator[List[str]]:
+    """Yield positional string rows from a Parquet/Feather file, batch by batch."""
 
-    if not rows:
-        LOGGER.info("Input CSV is empty. Nothing to expand.")
-        return []
+    table = _read_arrow_table(path)
+    for batch in table.to_batches(max_chunksize=_CHUNK_SIZE):
+        columns = [
+            ["" if value is None else str(value) for value in column.to_pylist()]
+            for column in batch.columns
+        ]
+        for row in zip(*columns):
+            yield list(row)
 
-    if TARGET_COLUMN not in rows[0]:
-        raise KeyError(f"Missing required column: {TARGET_COLUMN}")
-    if SOURCE_COLUMN not in rows[0]:
-        raise KeyError(f"Missing required column: {SOURCE_COLUMN}")
 
-    base_targets = {
-        _normalise_value(row.get(TARGET_COLUMN))
-        for row in rows
-        if _normalise_value(row.get(TARGET_COLUMN))
-    }
+def _write_csv(path: str, rows: Iterable[Sequence[str]], fieldnames: Sequence[str]) -> int:
+    """Write positional ``rows`` to ``path`` and return the number of data rows.
 
-    grouped_rows = {}
+    ``.parquet``/``.feather`` destinations are written through pyarrow.
+    """
 
-    for original in rows:
-        target_value = _normalise_value(original.get(TARGET_COLUMN))
-        if not target_value:
-            continue
-        grouped_rows.setdefault(target_value, []).append(dict(original))
-
-        for idx, layer in enumerate(layer_columns):
-            layer_value = _normalise_value(original.get(layer))
-            if not layer_value:
-                continue
-            if layer_value in base_targets:
-                LOGGER.debug("Skip layer '%s' because it already exists as a target", layer_value)
-                continue
-
-            new_row: Dict[str, str] = {TARGET_COLUMN: layer_value}
-            shift_position = 1
-            for tail_idx in range(idx + 1, len(layer_columns)):
-                tail_value = _normalise_value(original.get(layer_columns[tail_idx]))
-                if not tail_value:
-                    continue
-                new_row[f"Layer {shift_position}"] = tail_value
-                shift_position += 1
-
-            source_value = _normalise_value(original.get(SOURCE_COLUMN))
-            if source_value:
-                new_row[SOURCE_COLUMN] = source_value
-
-            grouped_rows.setdefault(layer_value, []).append(new_row)
-            LOGGER.debug("Added exploded row for layer '%s'", layer_value)
-
-    ordered_targets = []
-    for original in rows:
-        target_value = _normalise_value(original.get(TARGET_COLUMN))
-        if target_value and target_value not in ordered_targets:
-            ordered_targets.append(target_value)
-    for target in grouped_rows:
-        if target not in ordered_targets:
-            ordered_targets.append(target)
-
-    expanded = []
-    for target in ordered_targets:
-        expanded.extend(grouped_rows[target])
-
-    return expanded
-
-
-def _deduplicate_rows(
-    rows: Sequence[Dict[str, str]], fieldnames: Sequence[str]
-) -> List[Dict[str, str]]:
-    """Return ``rows`` with duplicate entries removed while preserving order."""
-
-    seen_signatures = set()
-    deduplicated: List[Dict[str, str]] = []
+    os.makedirs(os.path.dirname(path), exist_ok=True) if os.path.dirname(path) else None
+    if _is_arrow_path(path):
+        return _write_arrow(path, rows, fieldnames)
+    return lineage_expand.write_csv(path, rows, fieldnames)
+
+
+def _write_arrow(path: str, rows: Iterable[Sequence[str]], fieldnames: Sequence[str]) -> int:
+    """Stream ``rows`` into a zstd-compressed Parquet or Feather file."""
+
+    _require_pyarrow(path)
+    schema = pa.schema([(name, pa.string()) for name in fieldnames])
+    if path.lower().endswith(".parquet"):
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        # Feather V2 is the Arrow IPC file format, so batches can be appended.
+        writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    row_iter = iter(rows)
+    count = 0
+    with writer:
+        for chunk in iter(lambda: list(islice(row_iter, _CHUNK_SIZE)), []):
+            arrays = [pa.array(column, type=pa.string()) for column in zip(*chunk)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    return count
+
+
+def _collect_targets_arrow(path: str) -> tuple[FrozenSet[str], int] | None:
+    """Vectorised :func:`lineage_expand.collect_targets` that loads only the target column.
+
+    Trimming and de-duplication run inside pyarrow compute kernels instead of
+    per row in Python.  Returns ``None`` when pyarrow is not installed or
+    cannot parse a CSV ``path`` (ragged rows, invalid UTF-8, ...), in which
+    case the caller falls back to the csv module.
+    """
+
+    if pa is None:
+        return None
+    if _is_arrow_path(path):
+        table = _read_arrow_table(path, columns=[TARGET_COLUMN])
+    else:
+        try:
+            table = pa_csv.read_csv(
+                path,
+                parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=[TARGET_COLUMN],
+                    column_types={TARGET_COLUMN: pa.string()},
+                ),
+            )
+        except (pa.ArrowException, KeyError) as exc:
+            LOGGER.debug("pyarrow could not read %s (%s); falling back to csv", path, exc)
+            return None
+    column = pc.fill_null(table.column(TARGET_COLUMN).cast(pa.string()), "")
+    targets = pc.unique(pc.utf8_trim_whitespace(column))
+    return frozenset(value for value in targets.to_pylist() if value), table.num_rows
+
+
+def _row_signature(row: Sequence[str]) -> bytes:
+    """Return a compact 16-byte digest identifying ``row``'s cell values."""
+
+    return hashlib.blake2b("\x1f".join(row).encode("utf-8"), digest_size=16).digest()
+
+
+def _deduplicate_rows(rows: Iterable[List[str]]) -> Iterator[List[str]]:
+    """Yield ``rows`` with duplicate entries removed while preserving order."""
+
+    seen_signatures: Set[bytes] = set()
+    skipped = 0
+    debug = LOGGER.isEnabledFor(logging.DEBUG)
 
     for row in rows:
-        signature: Tuple[str, ...] = tuple(row.get(field, "") or "" for field in fieldnames)
+        signature = _row_signature(row)
         if signature in seen_signatures:
-            LOGGER.debug("Skipping duplicate row for signature: %s", signature)
+            if debug:
+                LOGGER.debug("Skipping duplicate row: %s", row)
+            skipped += 1
             continue
         seen_signatures.add(signature)
-        deduplicated.append(row)
+        yield row
 
-    return deduplicated
+    if skipped:
+        LOGGER.info("Removed %d duplicate rows after expansion", skipped)
 
 
 def main(argv: Sequence[str] | None = None) -> None:
@@ -218,35 +278,45 @@ def main(argv: Sequence[str] | None = None) -> None:
     logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.INFO), format="%(levelname)s: %(message)s")
 
     rows, original_fieldnames = _read_csv(args.input)
-    if not rows:
+    width = len(original_fieldnames)
+    if TARGET_COLUMN not in original_fieldnames:
+        base_targets: FrozenSet[str] = frozenset()
+        row_count = sum(1 for _ in rows)
+    else:
+        collected = _collect_targets_arrow(args.input)
+        if collected is None:
+            collected = lineage_expand.collect_targets(rows, original_fieldnames)
+        base_targets, row_count = collected
+
+    if not row_count:
         LOGGER.warning("Input CSV had no data rows. Writing empty output.")
         # still emit header so use discovered fieldnames
         fieldnames = original_fieldnames or [TARGET_COLUMN, SOURCE_COLUMN]
         _write_csv(args.output, [], fieldnames)
         return
 
-    layer_columns = _extract_layer_columns(original_fieldnames)
-    if not layer_columns:
+    if not lineage_expand.layer_columns(original_fieldnames):
         LOGGER.info("Input has no Layer columns. Copying rows as-is.")
-        _write_csv(args.output, rows, original_fieldnames)
+        _write_csv(args.output, _iter_rows(args.input, width), original_fieldnames)
         return
 
-    expanded_rows = expand_rows(rows, layer_columns)
-    fieldnames = original_fieldnames or [TARGET_COLUMN, *layer_columns, SOURCE_COLUMN]
-    deduplicated_rows = _deduplicate_rows(expanded_rows, fieldnames)
-    if len(deduplicated_rows) != len(expanded_rows):
-        LOGGER.info(
-            "Removed %d duplicate rows after expansion",
-            len(expanded_rows) - len(deduplicated_rows),
-        )
-    expanded_rows = deduplicated_rows
+    # Second pass: stream rows through expansion and de-duplication to disk.
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    expanded_rows = lineage_expand.expand(
+        _iter_rows(args.input, width),
+        original_fieldnames,
+        case_fold=False,
+        group_by_target=True,
+        known_targets=base_targets,
+        jobs=jobs,
+    )
+    written = _write_csv(args.output, _deduplicate_rows(expanded_rows), original_fieldnames)
     LOGGER.info(
         "Expanded %d original rows into %d rows (added %d exploded rows)",
-        len(rows),
-        len(expanded_rows),
-        len(expanded_rows) - len(rows),
+        row_count,
+        written,
+        written - row_count,
     )
-    _write_csv(args.output, expanded_rows, fieldnames)
 
 
 if __name__ == "__main__":
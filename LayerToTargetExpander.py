@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
-"""Expand lineage CSV by treating intermediate layers as targets."""
+"""Expand lineage CSV by treating intermediate layers as targets.
+
+Layer tables are matched case-insensitively and promoted once each; see
+:mod:`lineage_expand` for the shared expansion logic.
+"""
 
 from __future__ import annotations
 
@@ -7,149 +11,35 @@ import argparse
 import csv
 import logging
 from pathlib import Path
-from typing import Dict, List, Sequence, Set, Tuple
-
-
-def _extract_layer_index(column: str) -> int:
-    """Return the numeric index from a ``Layer N`` column name."""
-
-    try:
-        return int(column.split()[1])
-    except (IndexError, ValueError):
-        raise ValueError(f"Invalid layer column name: {column}") from None
-
-
-def _normalise_value(value: str | None) -> str:
-    """Trim surrounding whitespace and fallback to empty string."""
-
-    return value.strip() if value else ""
-
+from typing import Iterable, Iterator, List, Sequence, Tuple
 
-def _prepare_template(fieldnames: Sequence[str]) -> Dict[str, str]:
-    """Return a dict initialised with empty strings for all known columns."""
+import lineage_expand
 
-    return {name: "" for name in fieldnames}
 
-
-def expand_lineage_rows(
-    rows: Sequence[Dict[str, str]],
-    fieldnames: Sequence[str],
-    *,
-    target_column: str = "Target Table",
-    source_column: str = "Source Table",
-) -> List[Dict[str, str]]:
-    """
-    Expand lineage rows by promoting layer tables into the target column.
-
-    Each layer table inherits the downstream dependency chain from the source
-    row.  Newly created rows are appended to the original list while ensuring
-    that tables already listed as targets are not duplicated.
-    """
-
-    if target_column not in fieldnames:
-        raise KeyError(f"Input is missing required column: '{target_column}'")
-    if source_column not in fieldnames:
-        raise KeyError(f"Input is missing required column: '{source_column}'")
-
-    layer_columns: List[str] = [
-        name
-        for name in fieldnames
-        if name.startswith("Layer ")
-    ]
-    layer_columns.sort(key=_extract_layer_index)
-
-    if not layer_columns:
-        logging.info("No layer columns found. Nothing to expand.")
-        return [dict(row) for row in rows]
-
-    logging.debug("Detected layer columns: %s", ", ".join(layer_columns))
-
-    expanded_rows: List[Dict[str, str]] = [dict(row) for row in rows]
-
-    seen_targets: Set[str] = {
-        _normalise_value(row.get(target_column)).lower()
-        for row in rows
-        if _normalise_value(row.get(target_column))
-    }
-
-    for row in rows:
-        target_value = _normalise_value(row.get(target_column))
-        if not target_value:
-            logging.debug("Skipping row without target: %s", row)
-            continue
-
-        for idx, layer_column in enumerate(layer_columns):
-            layer_value = _normalise_value(row.get(layer_column))
-            if not layer_value:
-                continue
-
-            layer_key = layer_value.lower()
-            if layer_key in seen_targets:
-                logging.debug(
-                    "Layer '%s' already present as target. Skipping expansion.",
-                    layer_value,
-                )
-                continue
-
-            downstream_chain: List[str] = []
-            for next_col in layer_columns[idx + 1 :]:
-                next_value = _normalise_value(row.get(next_col))
-                if not next_value:
-                    break
-                downstream_chain.append(next_value)
-
-            source_value = _normalise_value(row.get(source_column))
-
-            new_row = _prepare_template(fieldnames)
-            new_row[target_column] = layer_value
-            for new_idx, chain_value in enumerate(downstream_chain, start=1):
-                col_name = f"Layer {new_idx}"
-                if col_name not in new_row:
-                    logging.debug(
-                        "Encountered dependency depth beyond known columns: %s",
-                        col_name,
-                    )
-                    continue
-                new_row[col_name] = chain_value
-            new_row[source_column] = source_value
-
-            logging.debug(
-                "Promoted layer '%s' to target with %d downstream layer(s).",
-                layer_value,
-                len(downstream_chain),
-            )
-
-            expanded_rows.append(new_row)
-            seen_targets.add(layer_key)
-
-    return expanded_rows
-
-
-def write_rows(path: Path, rows: Sequence[Dict[str, str]], fieldnames: Sequence[str]) -> None:
-    """Write lineage rows back to disk."""
+def write_rows(path: Path, rows: Iterable[Sequence[str]], fieldnames: Sequence[str]) -> int:
+    """Write positional lineage rows back to disk and return the row count."""
 
     if not fieldnames:
         raise ValueError("No column headers available for CSV output.")
 
     path.parent.mkdir(parents=True, exist_ok=True)
+    return lineage_expand.write_csv(path, rows, fieldnames)
 
-    with path.open("w", newline="", encoding="utf-8") as fh:
-        writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction="ignore")
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
 
+def load_rows(path: Path) -> Tuple[List[str], Iterator[List[str]]]:
+    """Load the header of a lineage CSV file and a lazy iterator over its rows.
 
-def load_rows(path: Path) -> Tuple[List[str], List[Dict[str, str]]]:
-    """Load rows from a lineage CSV file."""
+    The rows come from :func:`lineage_expand.iter_csv_rows`, so large files are
+    never held in memory.  The iterator is single-use: a further pass over the
+    file needs a fresh ``iter_csv_rows(path, len(fieldnames))``.
+    """
 
     with path.open("r", newline="", encoding="utf-8") as fh:
-        reader = csv.DictReader(fh)
-        if reader.fieldnames is None:
-            raise ValueError("Input CSV is missing a header row.")
-        fieldnames = list(reader.fieldnames)
-        rows = [dict(row) for row in reader]
-    return fieldnames, rows
+        header = next(csv.reader(fh), None)
+    if header is None:
+        raise ValueError("Input CSV is missing a header row.")
+    fieldnames = list(header)
+    return fieldnames, lineage_expand.iter_csv_rows(path, len(fieldnames))
 
 
 def main() -> None:
@@ -186,11 +76,19 @@ def main() -> None:
     )
 
     fieldnames, rows = load_rows(input_path)
-    logging.info("Loaded %d row(s) from %s", len(rows), input_path)
-
-    expanded_rows = expand_lineage_rows(rows, fieldnames)
-    logging.info("Writing %d row(s) to %s", len(expanded_rows), output_path)
-    write_rows(output_path, expanded_rows, fieldnames)
+    # First pass only gathers the existing targets; the second streams rows to disk.
+    known_targets, row_count = lineage_expand.collect_targets(rows, fieldnames, case_fold=True)
+    logging.info("Loaded %d row(s) from %s", row_count, input_path)
+
+    expanded_rows = lineage_expand.expand(
+        lineage_expand.iter_csv_rows(input_path, len(fieldnames)),
+        fieldnames,
+        case_fold=True,
+        group_by_target=False,
+        known_targets=known_targets,
+    )
+    written = write_rows(output_path, expanded_rows, fieldnames)
+    logging.info("Wrote %d row(s) to %s", written, output_path)
 
 
 if __name__ == "__main__":
@@ -22,83 +22,149 @@ preferring udp_src.* -> udpadms.* -> ads_stg.* if present.
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
+import mmap
 import os
 import re
+import sys
+from collections import ChainMap, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
-
+from functools import partial
+from itertools import islice
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple
+
+try:  # Optional: RE2 scans in linear time and matches many patterns in one pass.
+    import re2
+except ImportError:  # pragma: no cover - re2 is not a hard dependency
+    re2 = None
+
+
+def _re2_syntax(pattern: str, flags: int) -> str:
+    """Spell re.I/re.M/re.S as an inline group; RE2 takes no flag arguments."""
+    inline = "".join(letter for flag, letter in ((re.I, "i"), (re.M, "m"), (re.S, "s")) if flags & flag)
+    return f"(?{inline}){pattern}" if inline else pattern
+
+def _compile(pattern: str, flags: int = 0):
+    """Compile a whole-text scanning pattern with RE2 when installed.
+
+    Only for patterns run once over a text (one ``sub``/``finditer``) whose
+    matches are the same on both engines: RE2 re-encodes the str on every
+    call, so ``search(text, pos)`` loops turn quadratic, and its ``\\s`` and
+    ``\\b`` are ASCII-only while the stdlib's are Unicode.  Patterns RE2
+    rejects (look-aheads) stay on the stdlib engine.
+    """
+    if re2 is not None:
+        try:
+            return re2.compile(_re2_syntax(pattern, flags))
+        except re2.error:
+            pass
+    return re.compile(pattern, flags)
 
 # -----------------------------------------------------------------------------
 # File discovery
 # -----------------------------------------------------------------------------
 
 def iter_sas_files(root: str) -> Iterable[str]:
-    for base, _, files in os.walk(root):
-        for name in files:
-            if name.lower().endswith(".sas"):
-                yield os.path.join(base, name)
+    """Yield .sas paths under ``root`` using scandir's cached entry types.
+
+    Like os.walk: unreadable directories are skipped and symlinked
+    directories are listed but not descended into.  Directories wait on an
+    explicit stack, so deep trees need no recursion or nested generators.
+    """
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    pending.append(entry.path)
+            elif entry.name.lower().endswith(".sas"):
+                yield entry.path
+
 
+# Files at least this large are decoded straight from a memory map.
+MMAP_THRESHOLD = 1 << 20
 
 def read_text(path: str) -> str:
-    for enc in ("utf-8", "latin-1"):
-        try:
-            with open(path, "r", encoding=enc) as f:
-                return f.read()
-        except UnicodeDecodeError:
-            continue
-    with open(path, "r", encoding="utf-8") as f:  # pragma: no cover
-        return f.read()
+    """Read ``path`` once as bytes and decode (UTF-8, else latin-1).
+
+    Decoding in memory avoids re-opening the file when the UTF-8 attempt
+    fails; newlines are normalised the way text-mode reads would.  Large
+    files are decoded from an mmap, so no bytes copy of them is held.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                text = _decode(data)
+        else:
+            text = _decode(f.read())
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _decode(data: "bytes | mmap.mmap") -> str:
+    try:
+        return str(data, "utf-8")
+    except UnicodeDecodeError:
+        return str(data, "latin-1")
 
 
 # -----------------------------------------------------------------------------
 # Comment / string handling
 # -----------------------------------------------------------------------------
 
-RE_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+# Unrolled form of /\*.*?\*/: each character has exactly one way to match, so
+# the scan is linear without lazy-repeat backtracking (and DFA-friendly).
+RE_BLOCK_COMMENT = _compile(r"/\*[^*]*\*+(?:[^/*][^*]*\*+)*/")
+# \s must keep its Unicode meaning (RE2's is ASCII-only), so this stays on re.
 RE_LINE_COMMENT = re.compile(r"^\s*\*.*?;\s*$", re.M)
 
 def strip_comments(text: str) -> str:
-    """Remove /* ... */ and full-line '* ... ;' remarks."""
-    t = RE_BLOCK_COMMENT.sub(" ", text)
-    t = RE_LINE_COMMENT.sub("", t)
+    """Remove /* ... */ and full-line '* ... ;' remarks.
+
+    Line remarks are matched on the text left after block comments are
+    blanked (a block comment can hide the start of a line), so the two passes
+    stay sequential; each one is skipped when its marker cannot occur.
+    """
+    t = RE_BLOCK_COMMENT.sub(" ", text) if "/*" in text else text
+    if "*" in t:
+        t = RE_LINE_COMMENT.sub("", t)
     return t
 
 
+# A quoted literal runs to its closing quote (doubled quotes stay inside it),
+# or to the end of the text when unterminated.  The repeat can only stop at a
+# lone quote or at the end, where the tail always matches, so it never
+# backtracks; no possessive repeats, which PyPy's Python 3.10 re lacks.
+RE_STRING_LITERAL = re.compile(r"""'(?:[^']+|'')*(?:'|\Z)|"(?:[^"]+|"")*(?:"|\Z)""")
+
+def _blank(m: re.Match[str]) -> str:
+    return " " * (m.end() - m.start())
+
 def strip_string_literals(text: str) -> str:
     """Replace quoted strings with spaces to avoid false matches."""
-    out: List[str] = []
-    i, n = 0, len(text)
-    while i < n:
-        ch = text[i]
-        if ch in "'\"":
-            q = ch
-            j = i + 1
-            while j < n:
-                c = text[j]
-                if c == q:
-                    if j + 1 < n and text[j + 1] == q:  # doubled quote inside literal
-                        j += 2
-                        continue
-                    j += 1
-                    break
-                j += 1
-            else:
-                j = n
-            out.append(" " * (j - i))
-            i = j
-        else:
-            out.append(ch)
-            i += 1
-    return "".join(out)
+    # Plain substring checks run at memchr speed; most blocks have no literals.
+    if "'" not in text and '"' not in text:
+        return text
+    return RE_STRING_LITERAL.sub(_blank, text)
 
 
 # -----------------------------------------------------------------------------
 # Macro handling (sequential)
 # -----------------------------------------------------------------------------
 
+# Searched from successive positions, so this stays on re (see _compile).
 RE_MACRO_ASSIGN = re.compile(r"%let\s+([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([^;]*);", re.I)
-RE_MACRO_REF_DOTTED = re.compile(r"&([A-Za-z0-9_]+)\.")
-RE_MACRO_REF = re.compile(r"&([A-Za-z0-9_]+)")
+# One pass handles both forms: the optional '.' is the delimiter of '&name.'.
+# Expansion rewrites whole block bodies, so this runs on RE2 when available.
+RE_MACRO_REF = _compile(r"&([A-Za-z0-9_]+)\.?")
 
 def _sanitize_macro_value(v: str) -> str:
     """Remove quotes and simple %func(...) wrappers."""
@@ -115,19 +181,11 @@ def _sanitize_macro_value(v: str) -> str:
             break
     return val.strip()
 
-def expand_macros_once(text: str, macros: Dict[str, str]) -> Tuple[str, bool]:
+def expand_macros_once(text: str, macros: Mapping[str, str]) -> Tuple[str, bool]:
     """Single pass expansion for &name. and &name using given macros."""
     changed = False
 
-    def repl_dot(m: re.Match[str]) -> str:
-        nonlocal changed
-        name = m.group(1).lower()
-        if name in macros:
-            changed = True
-            return macros[name]
-        return m.group(0)
-
-    def repl_plain(m: re.Match[str]) -> str:
+    def repl(m: re.Match[str]) -> str:
         nonlocal changed
         name = m.group(1).lower()
         if name in macros:
@@ -135,25 +193,30 @@ def expand_macros_once(text: str, macros: Dict[str, str]) -> Tuple[str, bool]:
             return macros[name]
         return m.group(0)
 
-    t = RE_MACRO_REF_DOTTED.sub(repl_dot, text)
-    t = RE_MACRO_REF.sub(repl_plain, t)
+    t = RE_MACRO_REF.sub(repl, text)
     # SAS treats double dots as a single delimiter dot when a macro resolves to blank.
     t = t.replace("..", ".")
     return t, changed
 
-def expand_macros(text: str, macros: Dict[str, str], max_iter: int = 5) -> str:
+def expand_macros(text: str, macros: Mapping[str, str], max_iter: int = 5) -> str:
     """Iteratively expand &name/. references with the provided env."""
     cur = text
     for _ in range(max_iter):
+        if "&" not in cur:
+            # Nothing left to expand: the pass would only fold '..' and stop,
+            # so skip its regex scan (and the re-scan that confirms a fixed point).
+            return cur.replace("..", ".")
         cur, changed = expand_macros_once(cur, macros)
         if not changed:
             break
     return cur
 
-def eval_block_macro_assignments(block_text: str, env_in: Dict[str, str]) -> Dict[str, str]:
+def eval_block_macro_assignments(block_text: str, env_in: Mapping[str, str]) -> Dict[str, str]:
     """Evaluate %let inside a block using env_in; return dict of new/updated macros."""
     updates: Dict[str, str] = {}
     # We must evaluate sequentially to handle chained %let.
+    # Live view of incoming + previously updated in this block; no per-%let copy.
+    merged = ChainMap(updates, env_in)
     pos = 0
     while True:
         m = RE_MACRO_ASSIGN.search(block_text, pos)
@@ -162,7 +225,6 @@ def eval_block_macro_assignments(block_text: str, env_in: Dict[str, str]) -> Dic
         name = m.group(1).lower()
         raw_value = m.group(2)
         # Expand RHS with current env (incoming + previously updated in this block)
-        merged = {**env_in, **updates}
         expanded_rhs = expand_macros(raw_value, merged)
         sanitized = _sanitize_macro_value(expanded_rhs)
         updates[name] = sanitized
@@ -174,16 +236,19 @@ def eval_block_macro_assignments(block_text: str, env_in: Dict[str, str]) -> Dic
 # Block splitter
 # -----------------------------------------------------------------------------
 
-@dataclass
+@dataclass(slots=True)
 class Block:
-    kind: str      # "sql" or "data"
-    start: int     # start offset of the block header
-    end: int       # end offset of the block body (exclusive)
-    body: str      # text inside the block (after 'proc sql' / 'data ...' line)
-
-RE_START_SQL = re.compile(r"^\s*proc\s+sql\b.*?;", re.I | re.M | re.S)
+    kind: str        # "sql" or "data"
+    start: int       # start offset of the block header
+    body_start: int  # start offset of the body (after 'proc sql' / 'data ...' line)
+    end: int         # end offset of the block body (exclusive)
+
+# Both block headers in one pattern, so each block start costs a single search
+# (separate searches re-scanned the text for whichever header came later).
+# split_blocks searches these from successive positions, so they stay on re
+# (see _compile).
+RE_START_BLOCK = re.compile(r"^\s*(?:(proc\s+sql)|data)\b.*?;", re.I | re.M | re.S)
 RE_END_SQL = re.compile(r"\bquit\s*;\s*", re.I)
-RE_START_DATA = re.compile(r"^\s*data\b.*?;", re.I | re.M | re.S)
 RE_END_DATA = re.compile(r"\brun\s*;\s*", re.I)
 
 def split_blocks(text: str) -> List[Block]:
@@ -191,25 +256,15 @@ def split_blocks(text: str) -> List[Block]:
     blocks: List[Block] = []
     i, n = 0, len(text)
     while i < n:
-        ms = RE_START_SQL.search(text, i)
-        md = RE_START_DATA.search(text, i)
-        candidates = [(ms, "sql"), (md, "data")]
-        candidates = [(m, k) for (m, k) in candidates if m]
-        if not candidates:
+        m = RE_START_BLOCK.search(text, i)
+        if not m:
             break
-        m, kind = min(candidates, key=lambda t: t[0].start())
-        if kind == "sql":
-            endm = RE_END_SQL.search(text, m.end())
-            j = endm.end() if endm else n
-            body = text[m.end():j]
-            blocks.append(Block(kind="sql", start=m.start(), end=j, body=body))
-            i = j
-        else:
-            endm = RE_END_DATA.search(text, m.end())
-            j = endm.end() if endm else n
-            body = text[m.end():j]
-            blocks.append(Block(kind="data", start=m.start(), end=j, body=body))
-            i = j
+        kind = "sql" if m.group(1) else "data"
+        end_re = RE_END_SQL if kind == "sql" else RE_END_DATA
+        endm = end_re.search(text, m.end())
+        j = endm.end() if endm else n
+        blocks.append(Block(kind=kind, start=m.start(), body_start=m.end(), end=j))
+        i = j
     return blocks
 
 
@@ -219,8 +274,9 @@ def split_blocks(text: str) -> List[Block]:
 
 RE_TABLE_FQ = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)\.([A-Za-z_][A-Za-z0-9_]*)$")
 RE_TABLE_SIMPLE = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)$")
+RE_PLAIN_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?")
 
-RESERVED = {
+RESERVED: FrozenSet[str] = frozenset({
     "a","b","by","case","connect","connection","create","data","delete","do","else",
     "end","false","format","from","group","having","if","in","index","inner","into",
     "join","label","keep","left","length","libname","missing","not","null","on",
@@ -228,12 +284,17 @@ RESERVED = {
     "select","set","table","then","to","true","update","values","view","where",
     "while","with","work","hadoop","regexp_replace","eof","out","input","output",
     "name","type","noprint"
-}
+})
 
-def normalize_identifier(token: str, macros: Dict[str, str]) -> Optional[str]:
+def normalize_identifier(token: str, macros: Mapping[str, str]) -> Optional[str]:
     """Normalize to 'lib.member' (lowercased) or bare member; ignore _NULL_."""
     if not token:
         return None
+    # Statement captures are mostly a bare name already; every cleanup step
+    # below would be a no-op for them.
+    if RE_PLAIN_NAME.fullmatch(token):
+        return _classify_name(token)
+
     cleaned = token.strip().rstrip(';,').strip()
     # Strip dataset options / trailing parentheses.
     cleaned = cleaned.split("/", 1)[0]
@@ -241,11 +302,19 @@ def normalize_identifier(token: str, macros: Dict[str, str]) -> Optional[str]:
     if not cleaned:
         return None
 
-    expanded = expand_macros(cleaned, macros).strip()
+    # Block text is already expanded, so most tokens hold no '&'; for those
+    # expand_macros would only collapse '..', which is done directly.
+    if "&" in cleaned:
+        expanded = expand_macros(cleaned, macros).strip()
+    else:
+        expanded = cleaned.replace("..", ".").strip()
     expanded = expanded.strip("'\"").split("(", 1)[0].split("/", 1)[0].rstrip(".")
     if not expanded or "&" in expanded:
         return None
+    return _classify_name(expanded)
+
 
+def _classify_name(expanded: str) -> Optional[str]:
     if expanded.upper() == "_NULL_":
         return None
 
@@ -257,45 +326,67 @@ def normalize_identifier(token: str, macros: Dict[str, str]) -> Optional[str]:
     if m:
         cand = m.group(1)
         low = cand.lower()
-        if low in RESERVED or low.isdigit() or len(low) == 1:
+        # Cheapest test first: length, then digits, then the hash lookup.
+        if len(low) == 1 or low.isdigit() or low in RESERVED:
             return None
         return low
     return None
 
 
-def extract_identifiers_from_clause(clause: str, macros: Dict[str, str]) -> Iterable[str]:
-    """DATA/SET clause → multiple identifiers (handles 'data a b;')."""
+RE_INNER_PARENS = re.compile(r"\([^()]*\)")
+# Tokens are split on blanks, tabs, commas and '/'; newlines stay inside a token.
+RE_CLAUSE_TOKEN = re.compile(r"[^ ,\t/]+")
+
+def _drop_parenthesised(clause: str) -> str:
+    """Remove (possibly nested) dataset options such as ``(keep=a where=(b>1))``.
+
+    A stray ')' is ignored and an unclosed '(' swallows the rest of the clause.
+    """
+    if "(" not in clause and ")" not in clause:
+        return clause
+    prev = None
+    while prev != clause:
+        prev, clause = clause, RE_INNER_PARENS.sub("", clause)
+    return clause.replace(")", "").split("(", 1)[0]
+
+
+class IdentifierCache(dict):
+    """normalize_identifier results for one macro env, filled on first lookup.
+
+    The same token (``&syslast.``, a work table, ...) is matched many times
+    in a block; each distinct one is expanded and normalised only once.
+    """
+
+    def __init__(self, macros: Mapping[str, str]) -> None:
+        super().__init__()
+        self.macros = macros
+
+    def __missing__(self, token: str) -> Optional[str]:
+        norm = self[token] = normalize_identifier(token, self.macros)
+        return norm
+
+
+def extract_identifiers_from_clause(
+    clause: str, macros: Mapping[str, str], normalize: Optional[Callable[[str], Optional[str]]] = None
+) -> Iterable[str]:
+    """DATA/SET clause → multiple identifiers (handles 'data a b;').
+
+    ``normalize`` replaces ``normalize_identifier(tok, macros)``, e.g. with
+    an :class:`IdentifierCache` lookup.
+    """
     stripped = clause.strip()
     if not stripped or stripped.startswith('='):
         return
-    tokens: List[str] = []
-    cur: List[str] = []
-    depth = 0
-    for ch in clause:
-        if ch == '(':
-            depth += 1
-            continue
-        if ch == ')':
-            depth = max(0, depth - 1)
-            continue
-        if depth > 0:
-            continue
-        if ch in ' ,\t/;':
-            if cur:
-                tokens.append(''.join(cur))
-                cur = []
-            if ch == ';':
-                break
-            continue
-        cur.append(ch)
-    if cur:
-        tokens.append(''.join(cur))
+    tokens = RE_CLAUSE_TOKEN.findall(_drop_parenthesised(clause).split(";", 1)[0])
 
+    if normalize is None:
+        normalize = lambda tok: normalize_identifier(tok, macros)
     for tok in tokens:
-        low = tok.lower()
-        if low in RESERVED:
+        # RESERVED holds lower-case words and block text is already lower-cased;
+        # a mixed-case keyword that slips past is rejected by normalize anyway.
+        if tok in RESERVED:
             continue
-        norm = normalize_identifier(tok, macros)
+        norm = normalize(tok)
         if norm:
             yield norm
 
@@ -304,29 +395,189 @@ def extract_identifiers_from_clause(clause: str, macros: Dict[str, str]) -> Iter
 # Statement regexes (applied *inside a block* after expansion)
 # -----------------------------------------------------------------------------
 
-RE_CREATE_TABLE = re.compile(r"\bcreate\s+table\s+([A-Za-z0-9_.&]+)", re.I)
-RE_INSERT_INTO = re.compile(r"\binsert\s+into\s+([A-Za-z0-9_.&]+)", re.I)
-RE_FROM = re.compile(r"\bfrom\s+([A-Za-z0-9_.&]+)", re.I)
-RE_JOIN = re.compile(r"\bjoin\s+([A-Za-z0-9_.&]+)", re.I)
-RE_DATA_STMT = re.compile(r"^\s*data(?!\s*=)\s+([^;]+);", re.I | re.M)
-RE_SET_STMT  = re.compile(r"^\s*set(?!\s*=)\s+([^;]+);", re.I | re.M)
-RE_PROC_EXECUTE = re.compile(r"\b(?:insert\s+into|update\s+|delete\s+from)\s+([A-Za-z0-9_.]+)", re.I)
-RE_OUT_OPT = re.compile(r"\bout\s*=\s*([A-Za-z0-9_.&]+)", re.I)
-RE_BASE_OPT = re.compile(r"\bbase\s*=\s*([A-Za-z0-9_.&]+)", re.I)
-RE_DATA_OPT = re.compile(r"\bdata\s*=\s*([A-Za-z0-9_.&]+)", re.I)
+# The block text is lower-cased before scanning, so these patterns are
+# case-sensitive: no per-character case folding while matching.
+
+# Every statement in one left-to-right pass; ``m.lastgroup`` names the one
+# that matched.  Each branch consumes only its leading keyword and captures
+# the rest in a look-ahead, so a name that is itself a keyword ('from from x',
+# 'delete from t') is still scanned by the other branches; DATA/SET statements
+# consume nothing at all.  Only one branch can claim 'insert into x', so it
+# also reports the PROC EXECUTE reading of the name (see _execute_target).
+# RE_STATEMENT and both prefilters below are all derived from these branches.
+STATEMENT_BRANCHES: Tuple[str, ...] = (
+    r"\bcreate(?=\s+table\s+(?P<create_table>[a-z0-9_.&]+))",
+    r"\binsert(?=\s+into\s+(?P<insert_into>[a-z0-9_.&]+))",
+    r"\bdelete(?=\s+from\s+(?P<delete_from>[a-z0-9_.]+))",
+    r"\bupdate(?=\s+\s+(?P<update>[a-z0-9_.]+))",
+    r"\bfrom(?=\s+(?P<from>[a-z0-9_.&]+))",
+    r"\bjoin(?=\s+(?P<join>[a-z0-9_.&]+))",
+    r"\bout(?=\s*=\s*(?P<out_opt>[a-z0-9_.&]+))",
+    r"\bbase(?=\s*=\s*(?P<base_opt>[a-z0-9_.&]+))",
+    r"\bdata(?=\s*=\s*(?P<data_opt>[a-z0-9_.&]+))",
+    r"(?=^\s*data(?!\s*=)\s+(?P<data_stmt>[^;]+);)",
+    r"(?=^\s*set(?!\s*=)\s+(?P<set_stmt>[^;]+);)",
+)
+
+# Lower-case keywords, one of which every statement match contains: the
+# leading word of each branch once escapes such as \b and \s are removed.
+STATEMENT_KEYWORDS: Tuple[str, ...] = tuple(
+    dict.fromkeys(re.search(r"[a-z]+", re.sub(r"\\.", "", branch)).group() for branch in STATEMENT_BRANCHES)
+)
+
+# The leading guard (a keyword's first letter, or a line start for DATA/SET)
+# lets most positions fail on one character test instead of trying every branch.
+_STATEMENT_GUARD = "(?=[" + "".join(sorted({k[0] for k in STATEMENT_KEYWORDS})) + "]|^)"
+RE_STATEMENT = re.compile(_STATEMENT_GUARD + "(?:" + "|".join(STATEMENT_BRANCHES) + ")", re.M)
+
+
+# Every character the stdlib's Unicode \s matches (str.isspace), in RE2 syntax.
+_RE2_UNICODE_SPACE = (
+    r"[\t-\r\x1c-\x20\x85\xa0\x{1680}\x{2000}-\x{200a}\x{2028}\x{2029}\x{202f}\x{205f}\x{3000}]"
+)
+
+def _build_statement_set() -> Optional["re2.Set"]:
+    """Compile the statement branches into one RE2 set (None without re2).
+
+    The set must match every block the stdlib RE_STATEMENT would.  RE2 has
+    no look-arounds and its \\s/\\b are ASCII-only, so the look-aheads
+    become plain groups, the DATA/SET '=' guards and every \\b are dropped,
+    and \\s is spelled out as the Unicode whitespace class; the set then
+    matches a superset of blocks, which is all a prefilter needs.
+    """
+    if re2 is None:
+        return None
+    statement_set = re2.Set.SearchSet()
+    for branch in STATEMENT_BRANCHES:
+        branch = branch.replace(r"(?!\s*=)", "").replace("(?=", "(?:")
+        branch = re.sub(r"\(\?P<\w+>", "(", branch)
+        branch = branch.replace(r"\b", "").replace(r"\s", _RE2_UNICODE_SPACE)
+        statement_set.Add(_re2_syntax(branch, re.M))
+    statement_set.Compile()
+    return statement_set
+
+_STATEMENT_SET = _build_statement_set()
+
+def has_statement(block_text: str) -> bool:
+    """True when some statement pattern can match lower-cased ``block_text``.
+
+    With re2 installed this is a single DFA pass over the block; otherwise
+    it is a substring search for the statement keywords, which stops at the
+    first hit and is far cheaper than a regex scan.
+    """
+    if _STATEMENT_SET is None:
+        return any(k in block_text for k in STATEMENT_KEYWORDS)
+    return bool(_STATEMENT_SET.Match(block_text))
+
+WRITE_GROUPS: FrozenSet[str] = frozenset({"create_table", "insert_into", "update", "out_opt", "base_opt"})
+READ_GROUPS: FrozenSet[str] = frozenset({"delete_from", "from", "join", "data_opt"})
+
+# Matches of one statement never overlap, as when each had its own finditer:
+# a match starting inside the previous one of the same run is skipped.
+# PROC EXECUTE's INSERT/UPDATE/DELETE forms share one run.
+STATEMENT_RUNS: Dict[str, str] = {"update": "execute", "delete_from": "execute"}
+
+def _execute_target(token: str) -> str:
+    """The PROC EXECUTE reading of an insert target: it stops at '&'."""
+    return token.split("&", 1)[0]
 
 
 # -----------------------------------------------------------------------------
 # Per-file analysis (sequential blocks)
 # -----------------------------------------------------------------------------
 
-def analyse_sas_file(path: str) -> Tuple[Set[str], Set[str], Set[str]]:
-    raw = read_text(path)
+# Bump whenever a change to the analysis would alter results in --cache-dir.
+CACHE_VERSION = 2
+
+def _is_io_name(n: str, prefix: str) -> bool:
+    """True for ``prefix`` itself or ``prefix`` followed by digits (_input, _input2, ...)."""
+    if not n.startswith(prefix):
+        return False
+    tail = n[len(prefix):]
+    return (tail == "") or tail.isdigit()
+
+
+def io_macros(updates: Mapping[str, str]) -> Dict[str, str]:
+    """The SYSLAST/_INPUTn/_OUTPUTn entries of ``updates`` (lower-case names).
+
+    Only these macros name tables, so the per-block hint pass keeps them
+    apart as they are assigned instead of scanning every macro in scope.
+    """
+    return {
+        name: val for name, val in updates.items()
+        if name == "syslast" or _is_io_name(name, "_input") or _is_io_name(name, "_output")
+    }
+
+
+def _cache_file(cache_dir: str, key: str) -> str:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, f"v{CACHE_VERSION}", f"{digest}.json")
+
+
+def _load_cached_result(cache_file: str) -> Optional[Tuple[Set[str], Set[str], Set[str]]]:
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        return set(cached["inputs"]), set(cached["intermediates"]), set(cached["outputs"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _store_cached_result(cache_file: str, result: Tuple[Set[str], Set[str], Set[str]]) -> None:
+    inputs, intermediates, outputs = result
+    payload = {"inputs": sorted(inputs), "intermediates": sorted(intermediates), "outputs": sorted(outputs)}
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # Write then rename so concurrent workers never read a partial entry.
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # the cache is best effort
+
+
+def analyse_sas_file(path: str, cache_dir: Optional[str] = None) -> Tuple[Set[str], Set[str], Set[str]]:
+    """Return (inputs, intermediates, outputs) for one SAS file.
+
+    With ``cache_dir`` the result is stored under a digest of the file's
+    text and reused on later runs while the text (and CACHE_VERSION) match.
+    It is also stored under the file's path, mtime and size, so a file that
+    has not been touched since is answered without reading it.
+    """
+    if cache_dir is None:
+        return analyse_sas_text(read_text(path))
+
+    st = os.stat(path)
+    stat_file = _cache_file(cache_dir, f"stat\0{os.path.abspath(path)}\0{st.st_mtime_ns}\0{st.st_size}")
+    result = _load_cached_result(stat_file)
+    if result is None:
+        result = analyse_sas_source(read_text(path), cache_dir)
+        _store_cached_result(stat_file, result)
+    return result
+
+
+def analyse_sas_source(raw: str, cache_dir: Optional[str] = None) -> Tuple[Set[str], Set[str], Set[str]]:
+    """analyse_sas_text, going through the ``cache_dir`` result cache when given."""
+    if cache_dir is None:
+        return analyse_sas_text(raw)
+
+    cache_file = _cache_file(cache_dir, raw)
+    result = _load_cached_result(cache_file)
+    if result is None:
+        result = analyse_sas_text(raw)
+        _store_cached_result(cache_file, result)
+    return result
+
+
+def analyse_sas_text(raw: str) -> Tuple[Set[str], Set[str], Set[str]]:
     no_comments = strip_comments(raw)
     blocks = split_blocks(no_comments)
 
     # Evolving global macro env (lowercased keys)
     env: Dict[str, str] = {}
+    # The io_macros subset of env, maintained alongside it.
+    io_env: Dict[str, str] = {}
 
     read_tables: Set[str] = set()
     write_tables: Set[str] = set()
@@ -338,94 +589,72 @@ def analyse_sas_file(path: str) -> Tuple[Set[str], Set[str], Set[str]]:
         pre_updates = eval_block_macro_assignments(pre_slice, env)
         if pre_updates:
             env.update(pre_updates)
-
-        # Block-local env starts from current env
-        local_env = dict(env)
-
-        # First pass: evaluate %let inside the raw block using local_env
-        block_updates = eval_block_macro_assignments(b.body, local_env)
-        if block_updates:
-            local_env.update(block_updates)
-
-        # Expand block text *with block-local env* and strip strings
-        block_text = expand_macros(b.body, local_env)
-        block_text = strip_string_literals(block_text)
-
-        # Collect writes
-        for pat in (RE_CREATE_TABLE, RE_INSERT_INTO):
-            for m in pat.finditer(block_text):
-                norm = normalize_identifier(m.group(1), local_env)
-                if norm:
-                    write_tables.add(norm)
-
-        # Collect reads
-        for pat in (RE_FROM, RE_JOIN):
-            for m in pat.finditer(block_text):
-                norm = normalize_identifier(m.group(1), local_env)
-                if norm:
-                    read_tables.add(norm)
-
-        # DATA step targets/inputs
-        for m in RE_DATA_STMT.finditer(block_text):
-            for ident in extract_identifiers_from_clause(m.group(1), local_env):
-                write_tables.add(ident)
-        for m in RE_SET_STMT.finditer(block_text):
-            # Skip 'update' pattern immediately preceding the SET (heuristic)
-            start = m.start()
-            prev = block_text.rfind(';', 0, start)
-            snippet = block_text[prev + 1:start].lower() if prev >= 0 else block_text[:start].lower()
-            if 'update' in snippet:
-                continue
-            for ident in extract_identifiers_from_clause(m.group(1), local_env):
-                read_tables.add(ident)
-
-        # PROC EXECUTE (INSERT/UPDATE/DELETE)
-        for m in RE_PROC_EXECUTE.finditer(block_text):
-            norm = normalize_identifier(m.group(1), local_env)
-            if not norm:
-                continue
-            head = m.group(0).strip().lower()
-            if head.startswith("insert") or head.startswith("update"):
-                write_tables.add(norm)
-            else:
-                read_tables.add(norm)
-
-        # Option-style outputs/inputs
-        for m in RE_OUT_OPT.finditer(block_text):
-            norm = normalize_identifier(m.group(1), local_env)
-            if norm:
-                write_tables.add(norm)
-        for m in RE_BASE_OPT.finditer(block_text):
-            norm = normalize_identifier(m.group(1), local_env)
-            if norm:
-                write_tables.add(norm)
-        for m in RE_DATA_OPT.finditer(block_text):
-            norm = normalize_identifier(m.group(1), local_env)
+            io_env.update(io_macros(pre_updates))
+
+        # First pass: evaluate %let inside the raw block using the current env
+        body = no_comments[b.body_start:b.end]
+        block_updates = eval_block_macro_assignments(body, env)
+
+        # Block-local env layers this block's %let over the current env
+        # without copying it.
+        local_env: Mapping[str, str] = ChainMap(block_updates, env) if block_updates else env
+
+        # Expand block text *with block-local env*, strip strings and fold
+        # case once so the statement patterns need no re.I.
+        block_text = expand_macros(body, local_env)
+        block_text = strip_string_literals(block_text).lower()
+
+        normalize = IdentifierCache(local_env).__getitem__
+
+        # One pass over the block collects every statement; the prefilter
+        # skips it for blocks without any.
+        if has_statement(block_text):
+            run_ends: Dict[str, int] = {}
+            for m in RE_STATEMENT.finditer(block_text):
+                kind = m.lastgroup
+                token = m.group(kind)
+                start = m.start()
+                if kind == "insert_into":
+                    target = _execute_target(token)
+                    if target and start >= run_ends.get("execute", 0):
+                        run_ends["execute"] = m.start(kind) + len(target)
+                        norm = normalize(target)
+                        if norm:
+                            write_tables.add(norm)
+                run = STATEMENT_RUNS.get(kind, kind)
+                if start < run_ends.get(run, 0):
+                    continue
+                run_ends[run] = m.end(kind)
+                if kind in WRITE_GROUPS or kind in READ_GROUPS:
+                    tables = write_tables if kind in WRITE_GROUPS else read_tables
+                    norm = normalize(token)
+                    if norm:
+                        tables.add(norm)
+                elif kind == "data_stmt":
+                    # DATA step targets
+                    write_tables.update(extract_identifiers_from_clause(token, local_env, normalize))
+                else:
+                    # SET inputs; skip 'update' pattern immediately preceding the SET (heuristic).
+                    # Bounded finds look between the previous ';' and the SET without slicing.
+                    prev = block_text.rfind(';', 0, start)
+                    if block_text.find('update', prev + 1, start) >= 0:
+                        continue
+                    read_tables.update(extract_identifiers_from_clause(token, local_env, normalize))
+
+        # Macro hints present in *this block* (and inherited); only the
+        # SYSLAST/_INPUTn/_OUTPUTn values are worth normalising.
+        block_io = io_macros(block_updates) if block_updates else None
+        local_io = {**io_env, **block_io} if block_io else io_env
+        for name, val in local_io.items():
+            norm = normalize(val)
             if norm:
-                read_tables.add(norm)
-
-        # Macro hints present in *this block* (and inherited)
-        def is_io_name(n: str, prefix: str) -> bool:
-            if not n.startswith(prefix):
-                return False
-            tail = n[len(prefix):]
-            return (tail == "") or tail.isdigit()
-
-        for name, val in {**env, **block_updates}.items():
-            up = name.lower()
-            norm = normalize_identifier(val, local_env)
-            if not norm:
-                continue
-            if up == "syslast":
-                read_tables.add(norm)
-            if is_io_name(up, "_input"):
-                read_tables.add(norm)
-            if is_io_name(up, "_output"):
-                write_tables.add(norm)
+                (write_tables if name.startswith("_output") else read_tables).add(norm)
 
         # Merge this block's %let into global env for following blocks
         if block_updates:
             env.update(block_updates)
+            if block_io:
+                io_env.update(block_io)
 
         cursor = b.end
 
@@ -468,37 +697,74 @@ def main_chain(inputs: Set[str], inters: Set[str], outputs: Set[str]) -> Tuple[O
 # Formatting
 # -----------------------------------------------------------------------------
 
-def format_table_list(title: str, tables: Sequence[str], indent: str = "    ") -> List[str]:
-    lines = [f"{title}:"]
-    if tables:
-        for t in tables:
-            lines.append(f"{indent}- {t}")
-    else:
-        lines.append(f"{indent}(none)")
-    return lines
+def format_table_list(title: str, tables: Sequence[str], indent: str = "    ") -> str:
+    if not tables:
+        return f"{title}:\n{indent}(none)"
+    return f"{title}:\n" + "\n".join(f"{indent}- {t}" for t in tables)
+
+
+# Files read ahead of the one being analysed on the single-process path.
+READ_AHEAD = 8
+
+def prefetch_texts(paths: Sequence[str], depth: int = READ_AHEAD) -> Iterator[str]:
+    """read_text over ``paths`` in order, with up to ``depth`` reads in flight.
+
+    File reads release the GIL, so a reader thread keeps the disk busy while
+    the caller runs the regex work; at most ``depth`` texts wait in memory.
+    """
+    remaining = iter(paths)
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        pending = deque(reader.submit(read_text, path) for path in islice(remaining, depth))
+        while pending:
+            text = pending.popleft().result()
+            for path in islice(remaining, 1):
+                pending.append(reader.submit(read_text, path))
+            yield text
+
+
+def analyse_files(
+    paths: Sequence[str], jobs: int = 1, cache_dir: Optional[str] = None
+) -> Iterator[Tuple[Set[str], Set[str], Set[str]]]:
+    """analyse_sas_file over ``paths`` in order, across ``jobs`` processes if > 1."""
+    analyse = partial(analyse_sas_file, cache_dir=cache_dir)
+    if jobs <= 1 or len(paths) <= 1:
+        if cache_dir is None:
+            yield from map(analyse_sas_text, prefetch_texts(paths))
+        else:
+            # Reading ahead would defeat the stat-keyed cache, which skips reads.
+            yield from map(analyse, paths)
+        return
+    # Files are independent and the work is regex-bound, so processes (not threads) scale.
+    # About four chunks per worker keeps IPC round trips few while balancing load.
+    chunksize = max(1, len(paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(analyse, paths, chunksize=chunksize)
+
 
+def analyse_folder(root: str, jobs: int = 1, cache_dir: Optional[str] = None) -> Iterator[str]:
+    """Yield the report for ``root`` one file at a time.
 
-def analyse_folder(root: str) -> List[str]:
-    summaries: List[str] = []
-    any_file = False
-    for path in sorted(iter_sas_files(root)):
-        any_file = True
-        inputs, inters, outputs = analyse_sas_file(path)
+    Each chunk holds one or more lines without a trailing newline, so the
+    full report is ``"\n".join`` of the chunks; nothing is buffered across files.
+    """
+    paths = sorted(iter_sas_files(root))
+    for path, (inputs, inters, outputs) in zip(paths, analyse_files(paths, jobs, cache_dir)):
         rel = os.path.relpath(path, root)
-        summaries.append(f"=== {rel} ===")
-        summaries.extend(format_table_list("Input Tables", sorted(inputs)))
-        summaries.extend(format_table_list("Intermediate Tables", sorted(inters)))
-        summaries.extend(format_table_list("Output Tables", sorted(outputs)))
         # Main chain summary (helpful for DI jobs)
         s, m, t = main_chain(inputs, inters, outputs)
-        summaries.append("Main Chain (best effort):")
-        summaries.append(f"    Source      : {s or '(unknown)'}")
-        summaries.append(f"    Intermediate: {m or '(unknown)'}")
-        summaries.append(f"    Target      : {t or '(unknown)'}")
-        summaries.append("")
-    if not any_file:
-        summaries.append("No SAS files found.")
-    return summaries
+        yield "\n".join((
+            f"=== {rel} ===",
+            format_table_list("Input Tables", sorted(inputs)),
+            format_table_list("Intermediate Tables", sorted(inters)),
+            format_table_list("Output Tables", sorted(outputs)),
+            "Main Chain (best effort):",
+            f"    Source      : {s or '(unknown)'}",
+            f"    Intermediate: {m or '(unknown)'}",
+            f"    Target      : {t or '(unknown)'}",
+            "",
+        ))
+    if not paths:
+        yield "No SAS files found."
 
 
 # -----------------------------------------------------------------------------
@@ -508,10 +774,16 @@ def analyse_folder(root: str) -> List[str]:
 def main(argv: Optional[Sequence[str]] = None) -> int:
     parser = argparse.ArgumentParser(description="Trace table lineage in SAS DI scripts (sequential, block-scoped).")
     parser.add_argument("root", help="Root folder containing .sas files")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Worker processes; 0 uses every CPU (default: 1)")
+    parser.add_argument("--cache-dir", help="Reuse per-file results cached here, keyed by file content and by path/mtime/size (e.g. ~/.cache/sas_tracer)")
     args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 (every CPU) or a positive worker count")
 
-    out = analyse_folder(os.path.abspath(args.root))
-    print("\n".join(out))
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    cache_dir = os.path.expanduser(args.cache_dir) if args.cache_dir else None
+    # Stream each file's report as soon as it is analysed.
+    sys.stdout.writelines(f"{chunk}\n" for chunk in analyse_folder(os.path.abspath(args.root), jobs, cache_dir))
     return 0
 
 
@@ -24,30 +24,33 @@ Author: Wu Tong
 
 import argparse
 import ast
+import functools
 import io
 import logging
 import os
 import re
 import sys
 import tokenize
-from collections import defaultdict, deque
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, List, Set, Tuple, Optional
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Sequence, Set, Tuple, Optional
 
+import lineage_expand
 from extract_sas_tables import (
     normalize_dataset as normalize_sas_dataset,
     parse_macros as parse_sas_macros,
 )
 
+try:  # Optional: RE2 scans whole files in linear time.
+    import re2
+except ImportError:  # pragma: no cover - re2 is not a hard dependency
+    re2 = None
+
 # ------------------------------
 # Regexes (case-insensitive for SQL verbs, case-sensitive for identifiers)
 # ------------------------------
 
-# --- replace the previous parse_output_tables_from_header with this strict version ---
-
-import re
-from typing import Set, Tuple
-
 # Canonical SAS library → Spark schema mapping and known aliases.
 SAS_DB_TO_SPARK_DB = {
     "udp_src": "ads_public",
@@ -81,38 +84,21 @@ RE_SAS_COMMENT_BLOCK = re.compile(r"/\*.*?\*/", re.DOTALL)
 # normalisation.
 RE_SAS_HEADER_FQTN = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)\.([A-Za-z_][A-Za-z0-9_]*)")
 
-# FQTN patterns (db.tbl) in code
-RE_CREATE_VIEW_L = re.compile(r"\bcreate\s+view\s+([a-z0-9_]+(?:\.[a-z0-9_]+)?)\b")
-RE_SPARK_TABLE_L = re.compile(r"spark\.table\(\s*['\"]([a-z0-9_]+)\.([a-z0-9_]+)['\"]\s*\)")
-RE_FROM_JOIN_L = re.compile(r"\b(?:from|join)\s+([a-z0-9_]+)\.([a-z0-9_]+)\b")
+# FQTN patterns (db.tbl) in code, always matched against lower-cased text.
+# Identifiers are ASCII, so these (and the other FQTN patterns below) use
+# re.ASCII: \b, \w and \s then test a byte table instead of Unicode properties.
+RE_CREATE_VIEW_L = re.compile(r"\bcreate\s+view\s+([a-z0-9_]+(?:\.[a-z0-9_]+)?)\b", re.ASCII)
+RE_SPARK_TABLE_L = re.compile(r"spark\.table\(\s*['\"]([a-z0-9_]+)\.([a-z0-9_]+)['\"]\s*\)", re.ASCII)
+RE_FROM_JOIN_L = re.compile(r"\b(?:from|join)\s+([a-z0-9_]+)\.([a-z0-9_]+)\b", re.ASCII)
 # Optional: keep insertInto fallback as a real writer signal
-RE_INSERT_INTO_L = re.compile(r"\.insertinto\(\s*['\"]([a-z0-9_]+)\.([a-z0-9_]+)['\"]\s*,")
-
-
-# Safer per-line alternative if big block fails: lines starting with '#   schema.table'
-RE_OUTPUT_LINE = re.compile(r"^#\s+([A-Za-z0-9_]+)\.([A-Za-z0-9_]+)\s*$", re.MULTILINE)
-
-# FROM/JOIN sources in SQL (db.tbl). Keep case-sensitive match for identifiers by post-check.
-RE_FROM_JOIN = re.compile(
-    r"\b(?:FROM|JOIN)\s+([A-Za-z0-9_]+)\.([A-Za-z0-9_]+)\b",
-    re.IGNORECASE
-)
-
-# spark.table('db.tbl') in Py files (keep quotes single or double)
-RE_SPARK_TABLE = re.compile(
-    r"spark\.table\(\s*['\"]([A-Za-z0-9_]+)\.([A-Za-z0-9_]+)['\"]\s*\)"
-)
+RE_INSERT_INTO_L = re.compile(r"\.insertinto\(\s*['\"]([a-z0-9_]+)\.([a-z0-9_]+)['\"]\s*,", re.ASCII)
 
-# Also allow DataFrameWriter insertInto('db.tbl') patterns as a fallback (not required, but helpful)
-RE_INSERT_INTO = re.compile(
-    r"\.insertInto\(\s*['\"]([A-Za-z0-9_]+)\.([A-Za-z0-9_]+)['\"]\s*,",
-)
 
 # Word boundary strict search for file prefilter (table name only)
 def word_boundary_pattern(name: str) -> re.Pattern:
     """Build a strict word-boundary regex for a *lower-cased* table name."""
     name_l = re.escape(name.lower())
-    return re.compile(rf"\b{name_l}\b")
+    return re.compile(rf"\b{name_l}\b", re.ASCII)
 
 def normalize_table_only(name: str) -> str:
     """Return table-only part in LOWER CASE (drop db if present)."""
@@ -120,6 +106,9 @@ def normalize_table_only(name: str) -> str:
     return base.lower()
 
 
+# Memoised on the source text, like _python_output_tables: identical copies
+# of a job are tokenised once.
+@functools.lru_cache(maxsize=None)
 def strip_python_comments(text: str) -> str:
     """Return Python source with ``#`` comments removed."""
 
@@ -157,8 +146,12 @@ class WriterInfo:
     kind: str  # 'spark', 'view', or 'sas'
 
 def to_fqtn(db: str, tbl: str) -> str:
-    """Build lower-cased fully-qualified table name 'db.tbl'."""
-    return f"{db.lower()}.{tbl.lower()}"
+    """Build lower-cased fully-qualified table name 'db.tbl'.
+
+    Interned: the same names recur across the writer index, the caches and
+    every lineage path, so they share one object and compare by identity.
+    """
+    return sys.intern(f"{db.lower()}.{tbl.lower()}")
 
 def normalize_fqtn(name: str) -> Optional[str]:
     """Return lower-cased fully-qualified 'db.tbl', or None if input not qualified."""
@@ -168,7 +161,7 @@ def normalize_fqtn(name: str) -> Optional[str]:
 def word_boundary_pattern_fqtn(fqtn: str) -> re.Pattern:
     """Strict word-boundary regex for a lower-cased FQTN, with escaped dot."""
     pat = re.escape(fqtn)  # escapes the dot
-    return re.compile(rf"\b{pat}\b")
+    return re.compile(rf"\b{pat}\b", re.ASCII)
 
 
 def _normalize_sas_fqtn(raw_value: str) -> Optional[str]:
@@ -288,32 +281,93 @@ def extract_sas_lineage(text: str) -> Tuple[Set[str], Set[str]]:
 # File scanning & indexing
 # ------------------------------
 
+CODE_FILE_SUFFIXES = ('.py', '.sql', '.sas')
+
+
 def list_code_files(root: str) -> List[str]:
-    """List .py and .sql files under root recursively."""
-    targets = []
-    for base, _, files in os.walk(root):
-        for f in files:
-            ext = os.path.splitext(f)[1].lower()
-            if ext in ('.py', '.sql', '.sas'):
-                targets.append(os.path.join(base, f))
+    """List .py, .sql and .sas files under root recursively.
+
+    Uses os.scandir so entry types come from the directory listing instead of
+    a stat() per entry.  Order and semantics follow os.walk: a directory's
+    files come before its subdirectories, unreadable directories are skipped
+    and symlinked directories are not descended into.
+    """
+    targets: List[str] = []
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif entry.name.lower().endswith(CODE_FILE_SUFFIXES):
+                targets.append(entry.path)
+        pending.extend(reversed(subdirs))
     return targets
 
 
 def read_text(path: str) -> Optional[str]:
-    """Read file as UTF-8 (fallback to latin-1)."""
+    """Read file as UTF-8 (fallback to latin-1).
+
+    The bytes are read once and decoded in memory, so the latin-1 fallback
+    does not re-open the file; newlines are normalised as text mode would.
+    """
     try:
-        with open(path, 'r', encoding='utf-8') as fh:
-            return fh.read()
-    except UnicodeDecodeError:
-        try:
-            with open(path, 'r', encoding='latin-1') as fh:
-                return fh.read()
-        except Exception as e:
-            logging.warning("Failed to read %s: %s", path, e)
-            return None
+        with open(path, 'rb') as fh:
+            data = fh.read()
     except Exception as e:
         logging.warning("Failed to read %s: %s", path, e)
         return None
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        text = data.decode('latin-1')
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+# Writer indexing, candidate filtering and upstream extraction all revisit the
+# same files (once per looked-up table), so each file is read, decoded and
+# comment-stripped at most once per run.  Plain dicts rather than lru_cache so
+# that texts produced in worker processes can be primed back in (see
+# scan_files).
+_TEXT_CACHE: Dict[str, Optional[str]] = {}
+_SANITIZED_CACHE: Dict[str, Optional[str]] = {}
+
+
+def read_text_cached(path: str) -> Optional[str]:
+    """Memoised :func:`read_text`."""
+    try:
+        return _TEXT_CACHE[path]
+    except KeyError:
+        text = _TEXT_CACHE[path] = read_text(path)
+        return text
+
+
+def read_sanitized_text(path: str) -> Optional[str]:
+    """Cached file text with ``#`` comments stripped from ``.py`` sources."""
+    try:
+        return _SANITIZED_CACHE[path]
+    except KeyError:
+        pass
+    text = read_text_cached(path)
+    if text is not None and os.path.splitext(path)[1].lower() == '.py':
+        text = strip_python_comments(text)
+    _SANITIZED_CACHE[path] = text
+    return text
+
+
+@functools.lru_cache(maxsize=None)
+def read_sanitized_lower(path: str) -> Optional[str]:
+    """Lower-cased :func:`read_sanitized_text`, for case-insensitive name searches."""
+    text = read_sanitized_text(path)
+    return None if text is None else text.lower()
 
 
 # BEFORE
@@ -321,7 +375,7 @@ def read_text(path: str) -> Optional[str]:
 
 # AFTER — demand a strict right boundary: space/comma/semicolon/)/#/dash or EOL
 RE_FQTN_INLINE_L = re.compile(
-    r"\b([a-z0-9_]+)\.([a-z0-9_]+)(?=[\s,;)\]#\-]|$)"
+    r"\b([a-z0-9_]+)\.([a-z0-9_]+)(?=[\s,;)\]#\-]|$)", re.ASCII
 )
 
 
@@ -332,22 +386,35 @@ def _is_comment_or_blank(raw_line: str) -> bool:
     # Starts with typical comment markers: '#', '/*', '*', '--' (SQL), or banner lines
     return bool(re.match(r"^\s*(#|//|/\*|\*|--)", raw_line)) or bool(re.match(r"^\s*#{5,}\s*$", raw_line))
 
+# Leading comment and decoration characters of a header line.
+_RE_LEAD_TRIM = re.compile(r"^[\s#/\*\-\|>]+")
+
+
+def _strip_invisible(s: str) -> str:
+    """Drop BOM / zero-width spaces and turn NBSP into a space.
+
+    Chained str.replace beats str.translate here: these characters are
+    usually absent, and replace then returns ``s`` itself without copying.
+    """
+    return s.replace("\ufeff", "").replace("\u00a0", " ").replace("\u200b", "")
+
+
 def _normalize_line(s: str) -> str:
     """Lower-case, strip BOM/Unicode spaces, and collapse leading comment clutter."""
-    s = s.replace("\ufeff", "")           # BOM
-    s = s.replace("\u00a0", " ")          # NBSP
-    s = s.replace("\u200b", "")           # zero-width space
-    s = s.lower().rstrip()
+    s = _strip_invisible(s).lower().rstrip()
     # Remove leading comment and decoration characters but keep the raw line for comment detection
-    s = re.sub(r"^[\s#/\*\-\|>]+", "", s)
-    return s
+    return _RE_LEAD_TRIM.sub("", s)
+
+# 'output table(s)' header variants.  The stricter "label only" form the header
+# used to be checked against first is a special case of this prefix match.
+RE_OUTPUT_HEADER = re.compile(r"output\s+table(?:s)?\b")
+# Necessary for any header: lets files without one skip the line scan entirely.
+RE_OUTPUT_HEADER_HINT = re.compile(r"output\s+table")
+
 
 def _is_output_header(norm_line: str) -> bool:
     """Detect 'output table(s)' header variants."""
-    return (
-        re.match(r"^output\s+table(?:s)?(\s*[:：\-\u2013\u2014]\s*)?$", norm_line) is not None
-        or re.match(r"^output\s+table(?:s)?\b", norm_line) is not None
-    )
+    return RE_OUTPUT_HEADER.match(norm_line) is not None
 
 def _is_section_break(norm_line: str) -> bool:
     """Other headers that should end the current section."""
@@ -368,19 +435,28 @@ def parse_output_tables_from_header(text: str) -> Set[str]:
     - Stop the section when hitting a non-comment line OR another header-like line.
     """
     out: Set[str] = set()
+    # Clean and lower-case the whole text in one pass (as _normalize_line does
+    # per line); lines are then only trimmed when the loop actually reads them.
+    cleaned = _strip_invisible(text).lower()
+    if RE_OUTPUT_HEADER_HINT.search(cleaned) is None:
+        logging.debug("parse_output_tables_from_header: sections=0, tables=0 -> ")
+        return out
     raw_lines = text.splitlines()
-    norm_lines = [_normalize_line(ln) for ln in raw_lines]
+    low_lines = cleaned.splitlines()
+
+    def norm_line(idx: int) -> str:
+        return _RE_LEAD_TRIM.sub("", low_lines[idx].rstrip())
 
     i = 0
     sections = 0
-    while i < len(norm_lines):
-        if _is_output_header(norm_lines[i]):
+    while i < len(low_lines):
+        if "output" in low_lines[i] and _is_output_header(norm_line(i)):
             sections += 1
             logging.debug("OUTPUT header @ line %d: %r", i + 1, raw_lines[i])
             i += 1
             # consume this section inside the comment block only
-            while i < len(norm_lines):
-                norm = norm_lines[i]
+            while i < len(low_lines):
+                norm = norm_line(i)
                 raw  = raw_lines[i]
 
                 # Hard stop if we left the comment block (entered real code)
@@ -395,7 +471,7 @@ def parse_output_tables_from_header(text: str) -> Set[str]:
 
                 # extract all db.tbl tokens from this comment line
                 for db, tbl in RE_FQTN_INLINE_L.findall(norm):
-                    fq = f"{db}.{tbl}"
+                    fq = sys.intern(f"{db}.{tbl}")
                     out.add(fq)
                     logging.debug("  FQTN @ line %d: %s   (raw: %r)", i + 1, fq, raw)
                 i += 1
@@ -546,83 +622,175 @@ class PythonOutputExtractor(ast.NodeVisitor):
 
 def extract_output_tables_from_python(text: str) -> Set[str]:
     """Parse Python source code to identify DataFrame write targets."""
+    return set(_python_output_tables(text))
+
+
+# Copied boilerplate jobs often share their exact source, so the AST walk is
+# memoised on the text itself (its hash is computed once per string object).
+@functools.lru_cache(maxsize=None)
+def _python_output_tables(text: str) -> FrozenSet[str]:
     try:
         tree = ast.parse(text)
     except SyntaxError as exc:
         logging.debug("Failed to parse Python AST: %s", exc)
-        return set()
+        return frozenset()
 
     extractor = PythonOutputExtractor()
     extractor.visit(tree)
-    return extractor.tables
+    return frozenset(extractor.tables)
 
 
 def parse_insertinto_targets(text: str) -> Set[str]:
-    t = text.lower()
-    return {to_fqtn(db, tbl) for db, tbl in RE_INSERT_INTO_L.findall(t)}
+    return _insertinto_targets_lower(text.lower())
+
+
+def _insertinto_targets_lower(text_lower: str) -> Set[str]:
+    """parse_insertinto_targets for text that is already lower-cased."""
+    return {to_fqtn(db, tbl) for db, tbl in RE_INSERT_INTO_L.findall(text_lower)}
 
 def parse_view_name(text: str) -> Optional[str]:
     """
     Parse CREATE VIEW target and return lower-cased name.
     Prefer fully-qualified; if unqualified, return the bare name (caller may ignore).
     """
-    t = text.lower()
-    m = RE_CREATE_VIEW_L.search(t)
+    return _view_name_lower(text.lower())
+
+
+def _view_name_lower(text_lower: str) -> Optional[str]:
+    """parse_view_name for text that is already lower-cased."""
+    m = RE_CREATE_VIEW_L.search(text_lower)
     if not m:
         return None
     raw = m.group(1)
     return raw  # could be 'db.view' or just 'view'
 
 
-def index_writers(files: List[str]) -> Dict[str, List[WriterInfo]]:
+@dataclass
+class FileScan:
+    """Writer facts parsed from one file by :func:`scan_file`."""
+    code_outputs: Set[str]   # .py DataFrame write targets
+    sas_inputs: Set[str]
+    sas_outputs: Set[str]
+    insert_into: Set[str]
+    outputs: Dict[str, str]  # fqtn -> writer kind, in detection order
+    view: Optional[str]      # CREATE VIEW name of a .sql file
+
+
+def scan_file(p: str) -> Optional[FileScan]:
+    """Parse one file's writer facts; None if it cannot be read.
+
+    Touches no shared state beyond the read caches, so files can be scanned
+    concurrently.
+    """
+    text = read_text_cached(p)
+    if text is None:
+        return None
+    ext = os.path.splitext(p)[1].lower()
+    # Cheap substring checks on the cached lower-cased text (the mention index
+    # needs it anyway) let most files skip the AST and regex parsers below, and
+    # the regex parsers then run on that same text rather than a fresh copy.
+    searchable_lower = read_sanitized_lower(p)
+
+    detected_outputs: Dict[str, str] = {}
+    code_outs: Set[str] = set()
+    sas_inputs: Set[str] = set()
+    sas_outputs: Set[str] = set()
+
+    if ext == '.py':
+        # Every AST hit hangs off a ``.write...`` attribute chain.
+        if "write" in searchable_lower:
+            code_outs = extract_output_tables_from_python(text)
+        for fqtn in code_outs:
+            detected_outputs[fqtn] = 'spark'
+        if not code_outs:
+            header_outs = parse_output_tables_from_header(text)
+            for fqtn in header_outs:
+                detected_outputs.setdefault(fqtn, 'spark')
+    elif ext == '.sas':
+        sas_inputs, sas_outputs = extract_sas_lineage(text)
+        for fqtn in sas_outputs:
+            detected_outputs[fqtn] = 'sas'
+    else:
+        header_outs = parse_output_tables_from_header(text)
+        for fqtn in header_outs:
+            detected_outputs.setdefault(fqtn, 'spark')
+
+    ins_into = _insertinto_targets_lower(searchable_lower) if ".insertinto(" in searchable_lower else set()
+    for fqtn in ins_into:
+        detected_outputs.setdefault(fqtn, 'spark')
+
+    view = None
+    if ext == '.sql' and "create" in searchable_lower:
+        view = _view_name_lower(searchable_lower)  # may be bare; .sql text is not sanitised
+    return FileScan(code_outs, sas_inputs, sas_outputs, ins_into, detected_outputs, view)
+
+
+def _scan_file_with_texts(p: str) -> Tuple[Optional[FileScan], Optional[str], Optional[str]]:
+    """scan_file in a worker process, plus the texts it read for priming the parent's caches.
+
+    The sanitised text is None when it is the raw text itself (non-.py files).
+    """
+    scan = scan_file(p)
+    text = read_text_cached(p)
+    sanitized = read_sanitized_text(p)
+    return scan, text, (None if sanitized is text else sanitized)
+
+
+def scan_files(files: List[str], jobs: int = 1, processes: bool = False) -> Iterator[Optional[FileScan]]:
+    """scan_file over ``files`` in order, on ``jobs`` threads (or processes) if > 1.
+
+    Threads overlap the file reads, which dominate on network mounts.  The
+    comment stripping and AST parse are CPU-bound, so ``processes`` runs them
+    outside the GIL instead; each worker's decoded and sanitised texts are
+    copied back into this process's read caches, so the later mention index
+    and upstream parses do not redo them.
+    """
+    if jobs <= 1 or len(files) <= 1:
+        yield from map(scan_file, files)
+        return
+    if not processes:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            yield from executor.map(scan_file, files)
+        return
+    chunksize = max(1, len(files) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for p, (scan, text, sanitized) in zip(
+            files, executor.map(_scan_file_with_texts, files, chunksize=chunksize)
+        ):
+            _TEXT_CACHE.setdefault(p, text)
+            _SANITIZED_CACHE.setdefault(p, text if sanitized is None else sanitized)
+            yield scan
+
+
+def index_writers(files: List[str], jobs: int = 1, processes: bool = False) -> Dict[str, List[WriterInfo]]:
     index: Dict[str, List[WriterInfo]] = defaultdict(list)
     scanned = 0
     total_files = len(files)
     last_progress = 0
-    for idx, p in enumerate(files, start=1):
-        text = read_text(p)
-        if text is None:
+    for idx, (p, scan) in enumerate(zip(files, scan_files(files, jobs, processes)), start=1):
+        if scan is None:
             last_progress = log_progress("Indexing writers", idx, total_files, last_progress)
             continue
         scanned += 1
         ext = os.path.splitext(p)[1].lower()
-        sanitized_text = strip_python_comments(text) if ext == '.py' else text
-
-        detected_outputs: Dict[str, str] = {}
 
         if ext == '.py':
-            code_outs = extract_output_tables_from_python(text)
-            if code_outs:
-                logging.info("Code-based outputs in %s: %s", p, ", ".join(sorted(code_outs)))
+            if scan.code_outputs:
+                logging.info("Code-based outputs in %s: %s", p, ", ".join(sorted(scan.code_outputs)))
             else:
                 logging.debug("No code-based outputs detected in %s; falling back to headers.", p)
-            for fqtn in code_outs:
-                detected_outputs[fqtn] = 'spark'
-            if not code_outs:
-                header_outs = parse_output_tables_from_header(text)
-                for fqtn in header_outs:
-                    detected_outputs.setdefault(fqtn, 'spark')
         elif ext == '.sas':
-            sas_inputs, sas_outputs = extract_sas_lineage(text)
-            if sas_inputs:
-                logging.debug("SAS inputs in %s: %s", p, ", ".join(sorted(sas_inputs)))
-            if sas_outputs:
-                logging.info("SAS outputs in %s: %s", p, ", ".join(sorted(sas_outputs)))
+            if scan.sas_inputs:
+                logging.debug("SAS inputs in %s: %s", p, ", ".join(sorted(scan.sas_inputs)))
+            if scan.sas_outputs:
+                logging.info("SAS outputs in %s: %s", p, ", ".join(sorted(scan.sas_outputs)))
             else:
                 logging.debug("No SAS outputs detected in %s.", p)
-            for fqtn in sas_outputs:
-                detected_outputs[fqtn] = 'sas'
-        else:
-            header_outs = parse_output_tables_from_header(text)
-            for fqtn in header_outs:
-                detected_outputs.setdefault(fqtn, 'spark')
 
-        ins_into = parse_insertinto_targets(sanitized_text)
-        if ins_into:
-            logging.debug("insertInto hits in %s: %s", p, ", ".join(sorted(ins_into)))
-            for fqtn in ins_into:
-                detected_outputs.setdefault(fqtn, 'spark')
+        if scan.insert_into:
+            logging.debug("insertInto hits in %s: %s", p, ", ".join(sorted(scan.insert_into)))
 
+        detected_outputs = scan.outputs
         if detected_outputs:
             logging.info(
                 "Output-table hits in %s: %s",
@@ -633,11 +801,10 @@ def index_writers(files: List[str]) -> Dict[str, List[WriterInfo]]:
             if "." in fqtn:
                 index[fqtn].append(WriterInfo(file_path=p, kind=kind))
 
-        if ext == '.sql':
-            v = parse_view_name(text)  # lower-cased; may be bare
-            if v and "." in v:
-                index[v].append(WriterInfo(file_path=p, kind='view'))
-                #logging.info("Indexed View writer: %s -> %s", v, p)
+        v = scan.view
+        if v and "." in v:
+            index[v].append(WriterInfo(file_path=p, kind='view'))
+            #logging.info("Indexed View writer: %s -> %s", v, p)
 
         last_progress = log_progress("Indexing writers", idx, total_files, last_progress)
 
@@ -645,18 +812,6 @@ def index_writers(files: List[str]) -> Dict[str, List[WriterInfo]]:
                  scanned, len(index))
     return index
 
-def debug_scan_output_headers(root: str):
-    files = list_code_files(root)
-    logging.info("[DEBUG SCAN] searching potential output headers in %d files", len(files))
-    for p in files:
-        text = read_text(p)
-        if text is None:
-            continue
-        for idx, ln in enumerate(text.splitlines(), start=1):
-            low = ln.lower()
-            #if "output" in low and "table" in low:
-                #logging.info("[CAND] %s:%d  %r", p, idx, ln)
-
 
 # ------------------------------
 # Upstream extraction
@@ -672,50 +827,117 @@ def extract_upstreams_from_view(text: str) -> Set[str]:
 
 def get_upstreams_for_writer(writer: WriterInfo) -> Set[str]:
     """Read file and dispatch to appropriate extractor."""
-    text = read_text(writer.file_path)
+    return set(_upstreams_for_file(writer.file_path, writer.kind))
+
+
+# A script that writes several tables is the writer for each of them; parse
+# its upstreams once per (file, kind) rather than once per output table.
+@functools.lru_cache(maxsize=None)
+def _upstreams_for_file(file_path: str, kind: str) -> FrozenSet[str]:
+    text = read_text_cached(file_path)
     if text is None:
-        return set()
-    ext = os.path.splitext(writer.file_path)[1].lower()
-    sanitized_text = strip_python_comments(text) if ext == '.py' else text
-    if writer.kind == 'spark':
-        return extract_upstreams_from_spark(sanitized_text)
-    elif writer.kind == 'view':
-        return extract_upstreams_from_view(text)
-    elif writer.kind == 'sas':
+        return frozenset()
+    if kind == 'spark':
+        # Same as extract_upstreams_from_spark(sanitized text), reusing the cached lower-cased copy.
+        return frozenset(to_fqtn(db, tbl) for db, tbl in RE_SPARK_TABLE_L.findall(read_sanitized_lower(file_path)))
+    elif kind == 'view':
+        return frozenset(extract_upstreams_from_view(text))
+    elif kind == 'sas':
         inputs, _ = extract_sas_lineage(text)
-        return inputs
+        return frozenset(inputs)
     else:
-        return set()
+        return frozenset()
 
 
 # ------------------------------
 # Candidate filtering by strict name hit
 # ------------------------------
 
+def _compile_scanner(pattern: str):
+    """Compile a whole-file ASCII scanning pattern, with RE2 when installed.
+
+    RE2's ``\\w`` is ASCII-only, matching ``re.ASCII``.
+    """
+    if re2 is not None:
+        try:
+            return re2.compile(pattern)
+        except re2.error:
+            pass
+    return re.compile(pattern, re.ASCII)
+
+
+# Maximal dotted word chains ("db.tbl", "cat.db.tbl").  Each adjacent pair of
+# words in a chain is exactly a hit of ``\bword\.word\b`` at that spot, so one
+# scan per file yields every FQTN the strict word-boundary search would find.
+# Both use ASCII words to share word_boundary_pattern_fqtn's notion of a word.
+RE_DOTTED_CHAIN = _compile_scanner(r"\w+(?:\.\w+)+")
+# Names of this shape can be answered from the mention index.
+RE_INDEXABLE_FQTN = re.compile(r"\w+\.\w+", re.ASCII)
+
+
+def extract_fqtn_mentions(text_lower: str) -> Set[str]:
+    """Return every ``word.word`` name that occurs word-bounded in ``text_lower``."""
+    names: Set[str] = set()
+    for chain in RE_DOTTED_CHAIN.findall(text_lower):
+        parts = chain.split(".")
+        names.update(f"{a}.{b}" for a, b in zip(parts, parts[1:]))
+    return names
+
+
+def index_fqtn_mentions(files: List[str]) -> Dict[str, List[str]]:
+    """Map each lower-cased FQTN to the files that mention it (comments excluded for .py)."""
+    index: Dict[str, List[str]] = defaultdict(list)
+    for p in files:
+        searchable_lower = read_sanitized_lower(p)
+        if searchable_lower is None:
+            continue
+        for name in extract_fqtn_mentions(searchable_lower):
+            index[name].append(p)
+    logging.info("Indexed %d distinct FQTN mention(s) across %d files.", len(index), len(files))
+    return index
+
+
 def filter_candidate_files_by_name(files: List[str], fqtn: str) -> List[str]:
     """
     Prefilter files by LOWER-CASED FQTN occurrence.
     """
-    pat = word_boundary_pattern_fqtn(fqtn)
+    pat: Optional[re.Pattern] = None
     out = []
     for p in files:
-        text = read_text(p)
-        if text is None:
+        searchable_lower = read_sanitized_lower(p)
+        # A plain substring test rejects most files before any regex runs;
+        # the word-boundary pattern only confirms the remaining hits.
+        if searchable_lower is None or fqtn not in searchable_lower:
             continue
-        ext = os.path.splitext(p)[1].lower()
-        searchable_text = strip_python_comments(text) if ext == '.py' else text
-        if pat.search(searchable_text.lower()):
+        if pat is None:
+            pat = word_boundary_pattern_fqtn(fqtn)
+        if pat.search(searchable_lower):
             out.append(p)
     return out
 
 
+def find_candidate_files(
+    files: List[str],
+    fqtn: str,
+    mention_index: Optional[Dict[str, List[str]]] = None,
+) -> List[str]:
+    """Files mentioning ``fqtn``: a mention-index lookup when possible, else a scan."""
+    if mention_index is not None and RE_INDEXABLE_FQTN.fullmatch(fqtn):
+        return mention_index.get(fqtn, [])
+    return filter_candidate_files_by_name(files, fqtn)
+
+
 def find_writers_for_table(
     fqtn: str,
     all_files: List[str],
-    global_index: Dict[str, List[WriterInfo]]
+    global_index: Dict[str, List[WriterInfo]],
+    mention_index: Optional[Dict[str, List[str]]] = None,
 ) -> List[WriterInfo]:
     """
     Resolve writers for a fully-qualified table name (lower-cased).
+
+    ``mention_index`` (from :func:`index_fqtn_mentions` over ``all_files``)
+    replaces the per-table rescan of every file when given.
     """
     fqtn = fqtn.lower()
     lookup_names: Set[str] = {fqtn}
@@ -725,7 +947,7 @@ def find_writers_for_table(
 
     candidate_set: Set[str] = set()
     for name in lookup_names:
-        candidate_set.update(filter_candidate_files_by_name(all_files, name))
+        candidate_set.update(find_candidate_files(all_files, name, mention_index))
     candidates = sorted(candidate_set)
     logging.info("FQTN '%s': %d candidate files by strict FQTN search", fqtn, len(candidates))
 
@@ -740,11 +962,11 @@ def find_writers_for_table(
     if not writers:
         # direct parse as fallback (should rarely be needed if index is built)
         for p in candidates:
-            text = read_text(p)
+            text = read_text_cached(p)
             if text is None:
                 continue
             ext = os.path.splitext(p)[1].lower()
-            sanitized_text = strip_python_comments(text) if ext == '.py' else text
+            sanitized_text = read_sanitized_text(p)
             if ext == '.sas':
                 _, sas_outputs = extract_sas_lineage(text)
                 if any(name in sas_outputs for name in lookup_names):
@@ -778,13 +1000,42 @@ def find_writers_for_table(
 # Lineage expansion
 # ------------------------------
 
+@dataclass(slots=True)
+class LineageNode:
+    """A table in the lineage DAG; ``upstreams`` nodes are shared by every path through them."""
+    fqtn: str
+    upstreams: List["LineageNode"]  # empty for a source or a cycle cut
+    depth: int = 1                  # tables on the longest path from here to a source
+    path_count: int = 1             # number of paths from here to a source
+
+
+def iter_lineage_paths(root: LineageNode) -> Iterator[Tuple[str, ...]]:
+    """Yield every path from ``root`` down to a source, in DFS order."""
+    if not root.upstreams:
+        yield (root.fqtn,)
+        return
+    path: List[str] = [root.fqtn]
+    pending = [iter(root.upstreams)]
+    while pending:
+        node = next(pending[-1], None)
+        if node is None:
+            pending.pop()
+            path.pop()
+        elif node.upstreams:
+            path.append(node.fqtn)
+            pending.append(iter(node.upstreams))
+        else:
+            yield (*path, node.fqtn)
+
+
 def dfs_lineage_paths(
     start_fqtn: str,
     all_files: List[str],
     writers_index: Dict[str, List[WriterInfo]],
     visited_stack: Optional[List[str]] = None,
     cache_upstreams: Optional[Dict[str, Set[str]]] = None,
-    cache_paths: Optional[Dict[str, List[List[str]]]] = None,
+    cache_paths: Optional[Dict[str, LineageNode]] = None,
+    mention_index: Optional[Dict[str, List[str]]] = None,
 ) -> List[List[str]]:
     """
     Depth-first enumerate all lineage paths from a fully-qualified table (FQTN: db.tbl) to sources.
@@ -794,8 +1045,10 @@ def dfs_lineage_paths(
     - If no writers or upstream set is empty, the node is treated as a source.
     - Cycle-safe via 'visited_stack' (FQTN-based).
     - ``cache_upstreams`` memoises the immediate upstream sets for each table.
-    - ``cache_paths`` memoises the full lineage paths for each table so repeated lookups reuse the
-      previously computed dependency tree.
+    - ``cache_paths`` memoises, per table, its :class:`LineageNode` so shared ancestors are
+      expanded (and stored) once.  Subtrees in which a cycle was cut depend on the current
+      stack and are never cached.
+    - ``mention_index`` is passed through to :func:`find_writers_for_table`.
     """
     if visited_stack is None:
         visited_stack = []
@@ -804,58 +1057,100 @@ def dfs_lineage_paths(
     if cache_paths is None:
         cache_paths = {}
 
-    # Normalize to lower-case FQTN just in case upstream callers didn't
-    start_fqtn = start_fqtn.lower()
-
-    # Cycle guard
-    if start_fqtn in visited_stack:
-        logging.warning("Cycle detected at %s. Cutting branch.", start_fqtn)
-        return [[start_fqtn]]  # cut the branch at the cycle
-
-    # Full-path memoization
-    if start_fqtn in cache_paths:
-        cached_paths = cache_paths[start_fqtn]
-        logging.debug(
-            "Lineage cache hit for %s -> %d path(s)",
-            start_fqtn,
-            len(cached_paths),
-        )
-        return [path[:] for path in cached_paths]
+    root, _ = _lineage_tree(
+        start_fqtn, all_files, writers_index, visited_stack, cache_upstreams, cache_paths, mention_index
+    )
+    return [list(path) for path in iter_lineage_paths(root)]
 
-    # Find writers for this FQTN
-    writers = find_writers_for_table(start_fqtn, all_files, writers_index)
 
-    # Collect upstreams (union across writers)
-    upstream_union: Set[str] = set()
+def _lineage_tree(
+    start_fqtn: str,
+    all_files: List[str],
+    writers_index: Dict[str, List[WriterInfo]],
+    visited_stack: List[str],
+    cache_upstreams: Dict[str, Set[str]],
+    cache_paths: Dict[str, LineageNode],
+    mention_index: Optional[Dict[str, List[str]]],
+) -> Tuple[LineageNode, bool]:
+    """Return (lineage DAG rooted at ``start_fqtn``, whether a cycle was cut below it).
+
+    Iterative DFS: ``frames`` is the explicit stack of tables still expanding
+    their upstreams, so deep lineage costs no Python recursion and no
+    per-level copy of the visited stack.
+    """
+    on_stack: Set[str] = set(visited_stack)
+    # [fqtn, iterator over its sorted upstreams, upstream nodes so far, cycle cut below]
+    frames: List[list] = []
+
+    def visit(fqtn: str) -> Optional[Tuple[LineageNode, bool]]:
+        """Resolve ``fqtn`` directly, or push a frame and return None."""
+        # Normalize to lower-case FQTN just in case upstream callers didn't
+        fqtn = fqtn.lower()
+
+        # Cycle guard
+        if fqtn in on_stack:
+            logging.warning("Cycle detected at %s. Cutting branch.", fqtn)
+            return LineageNode(fqtn, []), True  # cut the branch at the cycle
+
+        # Full-path memoization
+        if fqtn in cache_paths:
+            cached = cache_paths[fqtn]
+            logging.debug(
+                "Lineage cache hit for %s -> %d path(s)",
+                fqtn,
+                cached.path_count,
+            )
+            return cached, False
+
+        # Upstreams are memoised per explored FQTN, so tables that are
+        # re-expanded (e.g. inside a cycle, where paths are not cached) skip
+        # the writer lookup and file parsing.
+        if fqtn in cache_upstreams:
+            upstream_union = cache_upstreams[fqtn]
+        else:
+            # Find writers for this FQTN and union their upstreams
+            upstream_union = set()
+            for w in find_writers_for_table(fqtn, all_files, writers_index, mention_index):
+                ups = get_upstreams_for_writer(w)  # returns a set of FQTN strings like 'db.tbl'
+                upstream_union |= ups
+            cache_upstreams[fqtn] = upstream_union
+
+        # No writers or no upstreams ⇒ treat as source
+        if not upstream_union:
+            logging.info("Table '%s' has no upstreams. Treat as source.", fqtn)
+            cache_paths[fqtn] = LineageNode(fqtn, [])
+            return cache_paths[fqtn], False
+
+        # Branch on each upstream FQTN
+        frames.append([fqtn, iter(sorted(upstream_union)), [], False])
+        on_stack.add(fqtn)
+        return None
 
-    # Optional memoization by FQTN to avoid re-parsing the same files repeatedly
-    if start_fqtn in cache_upstreams:
-        upstream_union = cache_upstreams[start_fqtn]
-    else:
-        for w in writers:
-            ups = get_upstreams_for_writer(w)  # returns a set of FQTN strings like 'db.tbl'
-            upstream_union |= ups
-        cache_upstreams[start_fqtn] = upstream_union
-
-    # No upstreams ⇒ treat as source
-    if not writers or len(upstream_union) == 0:
-        logging.info("Table '%s' has no upstreams. Treat as source.", start_fqtn)
-        cache_paths[start_fqtn] = [[start_fqtn]]
-        return [path[:] for path in cache_paths[start_fqtn]]
-
-    # Branch on each upstream FQTN
-    all_paths: List[List[str]] = []
-    for up_fqtn in sorted(upstream_union):
-        subpaths = dfs_lineage_paths(
-            up_fqtn, all_files, writers_index,
-            visited_stack=visited_stack + [start_fqtn],
-            cache_upstreams=cache_upstreams,
-            cache_paths=cache_paths
+    result = visit(start_fqtn)
+    while frames:
+        frame = frames[-1]
+        if result is not None:
+            # Attach the finished upstream to its parent.
+            frame[2].append(result[0])
+            frame[3] = frame[3] or result[1]
+            result = None
+        up_fqtn = next(frame[1], None)
+        if up_fqtn is not None:
+            result = visit(up_fqtn)
+            continue
+        frames.pop()
+        fqtn, _, upstreams, cycle_cut = frame
+        on_stack.discard(fqtn)
+        node = LineageNode(
+            fqtn,
+            upstreams,
+            depth=1 + max(up.depth for up in upstreams),
+            path_count=sum(up.path_count for up in upstreams),
         )
-        for sp in subpaths:
-            all_paths.append([start_fqtn] + sp)
-    cache_paths[start_fqtn] = [path[:] for path in all_paths]
-    return [path[:] for path in cache_paths[start_fqtn]]
+        if not cycle_cut:
+            cache_paths[fqtn] = node
+        result = node, cycle_cut
+    return result
 
 
 # ------------------------------
@@ -888,38 +1183,47 @@ def shape_paths_to_rows(target: str, paths: List[List[str]]) -> List[Dict[str, s
     return rows
 
 
+def lineage_columns(max_layers: int) -> List[str]:
+    """CSV header for paths with at most ``max_layers`` intermediate tables."""
+    return ["Target Table", *(f"Layer {i}" for i in range(1, max_layers + 1)), "Source Table"]
+
+
+def iter_lineage_rows(target: str, paths: Iterable[Sequence[str]], max_layers: int) -> Iterator[List[str]]:
+    """Positional counterpart of :func:`shape_paths_to_rows`, aligned with lineage_columns(max_layers)."""
+    for p in paths:
+        inter = p[1:-1]  # layers that still have upstreams (none for a one-node path)
+        yield [target, *inter, *([""] * (max_layers - len(inter))), p[-1]]
+
+
 # ------------------------------
 # CSV writer
 # ------------------------------
 
-def write_csv(rows: List[Dict[str, str]], out_path: str) -> None:
-    """Write rows to CSV with dynamic columns."""
-    if not rows:
+def write_lineage_csv(
+    lineage: Sequence[Tuple[str, LineageNode]],
+    max_layers: int,
+    out_path: str,
+) -> None:
+    """Write ``(target, lineage root)`` pairs straight to CSV as positional rows.
+
+    Paths are expanded from the shared DAG only while writing, and no dict is
+    built per row; ``max_layers`` (the longest path's intermediate count)
+    fixes the columns up front.  Rows go through :func:`lineage_expand.write_csv`,
+    which buffers the file and writes plain rows in batches.
+    """
+    total = sum(root.path_count for _, root in lineage)
+    if not total:
         logging.warning("No rows to write.")
-        # still write header?
-    # Determine columns
-    cols: List[str] = ["Target Table"]
-    max_layer = 0
-    for r in rows:
-        for k in r.keys():
-            if k.startswith("Layer "):
-                try:
-                    n = int(k.split()[1])
-                    max_layer = max(max_layer, n)
-                except Exception:
-                    pass
-    for i in range(1, max_layer + 1):
-        cols.append(f"Layer {i}")
-    cols.append("Source Table")
-
-    import csv
-    os.makedirs(os.path.dirname(out_path), exist_ok=True) if os.path.dirname(out_path) else None
-    with open(out_path, 'w', newline='', encoding='utf-8') as fh:
-        w = csv.DictWriter(fh, fieldnames=cols, extrasaction='ignore')
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
-    logging.info("Wrote %d rows to %s", len(rows), out_path)
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    rows = (
+        row
+        for target, root in lineage
+        for row in iter_lineage_rows(target, iter_lineage_paths(root), max_layers)
+    )
+    lineage_expand.write_csv(out_path, rows, lineage_columns(max_layers))
+    logging.info("Wrote %d rows to %s", total, out_path)
 
 
 # ------------------------------
@@ -937,7 +1241,17 @@ def tracer():
     )
     parser.add_argument("--out", default="lineage.csv", help="Output CSV path.")
     parser.add_argument("--log", default="INFO", help="Log level (DEBUG, INFO, WARNING).")
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=1,
+        help="Worker threads for reading and parsing files; 0 uses every CPU (default: 1)."
+    )
+    parser.add_argument(
+        "--processes", action="store_true",
+        help="Run the --jobs workers as processes, for CPU-bound parsing of large trees."
+    )
     args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 (every CPU) or a positive worker count")
 
     logging.basicConfig(
         level=getattr(logging, args.log.upper(), logging.INFO),
@@ -946,13 +1260,14 @@ def tracer():
 
     # 1) Scan files and build writers index FIRST (keys are lower-cased FQTN)
     logging.info("Scanning files under: %s", args.root)
-    debug_scan_output_headers(args.root)
     files = list_code_files(args.root)
     logging.info("Found %d candidate files (.py/.sql/.sas).", len(files))
 
     logging.info("Indexing writers from headers / CREATE VIEW...")
-    writers_index = index_writers(files)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    writers_index = index_writers(files, jobs, args.processes)
     logging.info("Indexed %d distinct output FQTN(s).", len(writers_index))
+    mention_index = index_fqtn_mentions(files)
 
     # Helper: normalize a target to lower-cased FQTN if already qualified, else None
     def _normalize_fqtn_or_none(t: str) -> Optional[str]:
@@ -960,12 +1275,17 @@ def tracer():
         t_low = t.lower()
         return t_low if "." in t_low else None
 
+    # Bare table name -> indexed FQTNs, built in one pass over the writers index
+    # instead of rescanning every key for each bare target.
+    fqtns_by_table: Dict[str, List[str]] = defaultdict(list)
+    for key in writers_index:
+        fqtns_by_table[key.rsplit(".", 1)[1]].append(key)
+
     # Helper: expand a bare table into candidate FQTNs using writers_index keys
     def _expand_bare_table(tbl_bare: str) -> List[str]:
         """Return all FQTNs from writers_index keys that end with '.tbl_bare'."""
         bare = tbl_bare.strip().lower()
-        suffix = f".{bare}"
-        cands = [k for k in writers_index.keys() if k.endswith(suffix)]
+        cands = fqtns_by_table.get(bare, [])
         if not cands:
             logging.warning("No FQTN candidates found for bare table '%s' in writers index.", tbl_bare)
         else:
@@ -1009,26 +1329,30 @@ def tracer():
         sys.exit(2)
 
     # 4) Run DFS for each target FQTN and write rows
-    all_rows: List[Dict[str, str]] = []
+    lineage: List[Tuple[str, LineageNode]] = []
+    max_layers = 0
     total_targets = len(fqtn_targets)
     target_progress = 0
     global_upstream_cache: Dict[str, Set[str]] = {}
-    global_path_cache: Dict[str, List[List[str]]] = {}
+    global_path_cache: Dict[str, LineageNode] = {}
     for idx, tgt_fqtn in enumerate(fqtn_targets, start=1):
         logging.info("=== [%d/%d] Start lineage for target: %s ===", idx, total_targets, tgt_fqtn)
-        paths = dfs_lineage_paths(
+        # Shared DAG straight from the memo; paths (FQTN at each hop) are expanded when written
+        root, _ = _lineage_tree(
             tgt_fqtn,
             files,
             writers_index,
-            cache_upstreams=global_upstream_cache,
-            cache_paths=global_path_cache,
+            [],
+            global_upstream_cache,
+            global_path_cache,
+            mention_index,
         )
-        rows = shape_paths_to_rows(tgt_fqtn, paths)  # paths contain FQTN at each hop
-        all_rows.extend(rows)
-        logging.info("=== [%d/%d] Done lineage for target: %s (paths=%d) ===", idx, total_targets, tgt_fqtn, len(paths))
+        lineage.append((tgt_fqtn, root))
+        max_layers = max(max_layers, root.depth - 2)
+        logging.info("=== [%d/%d] Done lineage for target: %s (paths=%d) ===", idx, total_targets, tgt_fqtn, root.path_count)
         target_progress = log_progress("Lineage expansion", idx, total_targets, target_progress)
 
-    write_csv(all_rows, args.out)
+    write_lineage_csv(lineage, max_layers, args.out)
 
 
 
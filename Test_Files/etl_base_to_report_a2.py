@@ -29,6 +29,7 @@ from pyspark.sql import SparkSession
 from pyspark.sql.functions import *
 from pyspark.sql.types import *
 from pyspark.sql.window import Window
+from pyspark import StorageLevel
 from pyspark_llap import HiveWarehouseSession
 
 spark_origin = SparkSession.builder.enableHiveSupport().getOrCreate()
@@ -46,6 +47,12 @@ dt_period_month = dt_end - datetime.timedelta(days = 1)
 #First day of previous month
 dt_start = dt_period_month.replace(day = 1)
 
+# Target tables, with their column order looked up from the metastore once.
+trans_target = 'rpt_udp.rpt_assessment_clubs_association'
+trans_target_cols = spark.table(trans_target).columns
+aggr_target = 'rpt_udp.rpt_assessment_clubs_association_aggr'
+aggr_target_cols = spark.table(aggr_target).columns
+
 #########################################################################################
 # Clubs & Associations. (Cognos Report: IRIN_DWER_AM212b)
 #########################################################################################
@@ -54,16 +61,22 @@ branch_ref = spark.table('rpt_udp.ref_branch_code_ctd').select(
     col('branch_desc')
 )
 
-rpt_assessment_clubs_association_df1 = spark.table('rpt_udp.rpt_non_financials').filter(
-    (col('dt_effective') >= dt_start) & (col('dt_effective') < dt_end)
-).filter("""
-    cd_trans_status = 6
-    AND cd_transaction IN (623,624,625,626,627,628,629)
-    AND cd_entity_class IN (410,420,430,431,440,450,451,452,453,454,470,471,480,490)
-""")
+# One where() of typed column predicates: each reaches the reader as its own
+# EqualTo/In/range filter, so row groups can be skipped on any of them.
+# rpt_non_financials is partitioned by period_month and each run of
+# etl_dv_to_base_a2 loads one month's dt_effective rows into it, so the
+# redundant period_month test lets the metastore prune to that one partition.
+rpt_assessment_clubs_association_df1 = spark.table('rpt_udp.rpt_non_financials').where(
+    (col('period_month') == dt_period_month) &
+    (col('dt_effective') >= dt_start) & (col('dt_effective') < dt_end) &
+    (col('cd_trans_status') == 6) &
+    col('cd_transaction').isin([623, 624, 625, 626, 627, 628, 629]) &
+    col('cd_entity_class').isin([410, 420, 430, 431, 440, 450, 451, 452, 453, 454, 470, 471, 480, 490])
+)
 
+# branch_ref is a tiny lookup: broadcast it so the fact side is never shuffled.
 rpt_assessment_clubs_association = rpt_assessment_clubs_association_df1.alias('a').join(
-    branch_ref.alias('b'), 'cd_grade', 'left'
+    broadcast(branch_ref).alias('b'), 'cd_grade', 'left'
 ).select(
     col('a.id_entity').alias('entity_id'),
     col('a.id_transaction'),
@@ -71,7 +84,28 @@ rpt_assessment_clubs_association = rpt_assessment_clubs_association_df1.alias('a
     year(col('a.dt_effective')).alias('fy'),
     col('a.dt_effective').alias('period_month'),
     col('b.branch_desc').alias('branch'),
-    col('a.cd_transaction'),
+    col('a.cd_transaction').alias('transaction_code'),
+    # Both transaction classifications are projected here, side by side, so the
+    # cd_transaction/am_nta tests sit in one project node.
+    expr("""
+        CASE
+            when cd_transaction IN (623, 624) AND am_nta <> 0 THEN 1
+            WHEN cd_transaction IN (625, 626) THEN 2
+            WHEN cd_transaction IN (623, 624) AND am_nta = 0 THEN 3
+            WHEN cd_transaction IN (627, 628) THEN 4
+            WHEN cd_transaction IN (629) THEN 5
+            ELSE 6
+        END
+    """).alias('cdtransaction'), # same name as the variable in Cognos report
+    expr("""
+        CASE
+            WHEN cd_transaction IN (623, 624) AND am_nta <> 0 THEN 'Original Asst with tax'
+            WHEN cd_transaction IN (625, 626) THEN 'Additional Assessments'
+            WHEN cd_transaction IN (623, 624) AND am_nta = 0 THEN 'Original Asst non-tax'
+            WHEN cd_transaction IN (627, 628) THEN 'Amended Assessments'
+            WHEN cd_transaction IN (629) THEN 'Repayment'
+        END
+    """).alias('assessment_type'),
     col('a.dt_effective'),
     col('a.am_prev_tax'),
     col('a.am_nettaxpayable'),
@@ -93,45 +127,12 @@ rpt_assessment_clubs_association = rpt_assessment_clubs_association_df1.alias('a
     )
 ).withColumn(
     "period_quarter",
-    when(
-        month("a.dt_effective").isin([4,5,6]), lit(1)
-    ).when(
-        month("a.dt_effective").isin([7,8,9]), lit(2)
-    ).when(
-        month("a.dt_effective").isin([10,11,12]), lit(3)
-    ).when(
-        month("a.dt_effective").isin([1,2,3]), lit(4)
-    ).otherwise(
-        lit(None)
-    )
-).withColumn(
-    'cdtransaction', # same name as the variable in Cognos report
-    expr("""
-        CASE
-            when cd_transaction IN (623, 624) AND am_nta <> 0 THEN 1
-            WHEN cd_transaction IN (625, 626) THEN 2
-            WHEN cd_transaction IN (623, 624) AND am_nta = 0 THEN 3
-            WHEN cd_transaction IN (627, 628) THEN 4
-            WHEN cd_transaction IN (629) THEN 5
-            ELSE 6
-        END
-    """)
-).withColumnRenamed('cd_transaction', 'transaction_code')
+    # Financial quarter from April: (m + 8) % 12 counts months from April
+    # (Apr=0 .. Mar=11), so 4-6 -> 1, 7-9 -> 2, 10-12 -> 3, 1-3 -> 4.
+    ((month("a.dt_effective") + 8) % 12 / 3 + 1).cast('int')
+)
 
-trans_df = rpt_assessment_clubs_association.withColumn(
-    'assessment_type',
-    when(
-        col('cdtransaction') == 1, 'Original Asst with tax'
-    ).when(
-        col('cdtransaction') == 2, 'Additional Assessments'
-    ).when(
-        col('cdtransaction') == 3, 'Original Asst non-tax'
-    ).when(
-        col('cdtransaction') == 4, 'Amended Assessments'
-    ).when(
-        col('cdtransaction') == 5, 'Repayment'
-    ).otherwise(lit(None))
-).select(
+trans_df = rpt_assessment_clubs_association.select(
     'fy',
     'period_month',
     'period_quarter',
@@ -152,9 +153,15 @@ trans_df = rpt_assessment_clubs_association.withColumn(
     'create_timestamp',current_timestamp()
 )
 
-trans_target = 'rpt_udp.rpt_assessment_clubs_association'
+# trans_df feeds both the detail write and the aggregate below; keep it
+# (serialised, spilling to disk) so its filter/join/derivations run once.
+trans_df = trans_df.persist(StorageLevel.MEMORY_AND_DISK_SER)
+
+# Both targets are partitioned by period_month: cluster rows by it first so each
+# partition is written by one task instead of a small file from every task.
 trans_df \
-    .select(spark.table(trans_target).columns) \
+    .repartition('period_month') \
+    .select(trans_target_cols) \
     .write \
     .format(HiveWarehouseSession().HIVE_WAREHOUSE_CONNECTOR) \
     .option('table', trans_target) \
@@ -203,11 +210,13 @@ final_aggr_df = trans_df.groupBy(
     'create_timestamp'
 )
 
-aggr_target = 'rpt_udp.rpt_assessment_clubs_association_aggr'
-final_df \
-    .select(spark.table(aggr_target).columns) \
+final_aggr_df \
+    .repartition('period_month') \
+    .select(aggr_target_cols) \
     .write \
     .format(HiveWarehouseSession().HIVE_WAREHOUSE_CONNECTOR) \
     .option('table', aggr_target) \
     .option('partition', 'period_month') \
     .save()
+
+trans_df.unpersist()
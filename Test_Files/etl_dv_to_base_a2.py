@@ -34,11 +34,15 @@ import datetime
 from pyspark.sql import SparkSession
 from pyspark.sql.types import *
 from pyspark.sql.functions import *
-from pyspark.sql.window import Window
 
 spark = SparkSession.builder.enableHiveSupport().getOrCreate()
 spark.conf.set('spark.sql.sources.partitionOverwriteMode', 'dynamic')
 spark.conf.set('hive.exec.dynamic.partition.mode', 'nonstrict')
+# Adaptive execution: split skewed join partitions at runtime (a few busy
+# id_transaction values otherwise leave straggler tasks) and merge small ones.
+spark.conf.set('spark.sql.adaptive.enabled', 'true')
+spark.conf.set('spark.sql.adaptive.skewJoin.enabled', 'true')
+spark.conf.set('spark.sql.adaptive.coalescePartitions.enabled', 'true')
 
 current_run = str(sys.argv[1]) # e.g. '2018-12-04'
 
@@ -55,31 +59,43 @@ year_start = current_year - 7
 
 # NOTE: DELTA filter should be [delta_start, delta_end)
 
-last_update_tms = concat_ws(' ', 'dt_last_update', 'tm_last_update').cast('timestamp')
+# Each satellite is projected down to the columns this job reads right after
+# spark.table(), so nothing else is carried into a shuffle or join.
+
+# Latest version per key: max(struct(order cols..., payload...)) keeps the row
+# with the greatest ordering tuple in one hash aggregation, instead of a sorted
+# row_number() window followed by row_no = 1.  The order is
+# (dt_last_update, tm_last_update, sat_load_dts): comparing the date and the
+# zero-padded HH:MM:SS time directly ranks rows as their combined timestamp
+# would, without building and parsing a timestamp string per row.
 
 #########################################################################################
 # Load non_fin_req
 #########################################################################################
-sat_non_fin_req_irin_df = spark.table('tax_dv.sat_non_fin_req_irin').filter(
+sat_non_fin_req_irin_df = spark.table('tax_dv.sat_non_fin_req_irin').select(
+    'hub_id_non_fin_req', 'id_transaction', 'id_trans_source', 'am_tax_liab', 'am_liability',
+    'cd_transaction', 'dt_effective', 'dt_last_update', 'tm_last_update', 'sat_load_dts',
+    'versionnumber'
+).filter(
     (col('dt_effective') >= delta_start) & (col('dt_effective') < delta_end)
-).withColumn(
-    "tm_last_update", last_update_tms
-).withColumn(
-    'row_no',
-    row_number().over(
-        Window.partitionBy('hub_id_non_fin_req', 'id_transaction').orderBy(desc('tm_last_update'), desc('sat_load_dts'))
-    )
-).filter('row_no = 1').select(
+).groupBy(
+    'hub_id_non_fin_req', 'id_transaction'
+).agg(
+    max(struct(
+        'dt_last_update',
+        'tm_last_update',
+        'sat_load_dts',
+        'id_trans_source',
+        'am_tax_liab',
+        col('am_liability').alias('am_nta'),
+        'cd_transaction',
+        'dt_effective',
+        'versionnumber'
+    )).alias('latest')
+).select(
     'hub_id_non_fin_req',
-    'id_trans_source',
-    'am_tax_liab',
     'id_transaction',
-    col('am_liability').alias('am_nta'),
-    'cd_transaction',
-    'dt_last_update',
-    'tm_last_update',
-    'dt_effective',
-    'versionnumber'
+    'latest.*'
 )
 
 stg_non_financials_df = spark.table('tax_dv.hub_non_fin_req').alias('hub').filter(
@@ -101,20 +117,47 @@ stg_non_financials_df = spark.table('tax_dv.hub_non_fin_req').alias('hub').filte
 #########################################################################################
 # Load forms data
 #########################################################################################
-sat_forms_hdr_df = spark.table('tax_dv.sat_forms_hdr_irin').withColumn(
-    'tm_last_update', last_update_tms
-).filter(
+# Static column predicates go straight onto the scan, ahead of any derived
+# column, so the reader can push them down and skip row groups/partitions.
+# sat_rec_src is checked after the dedupe: it flags the latest version only.
+sat_forms_hdr_df = spark.table('tax_dv.sat_forms_hdr_irin').select(
+    'hub_id_forms', 'cd_tax', 'cd_asmt_status', 'yr_form', 'sat_rec_src', 'dt_tax_pd_begin',
+    'dt_tax_pd_end', 'cd_update_source', 'cd_update_reason', 'id_updated_by', 'id_transaction',
+    'id_rtn_seq', 'dt_created', 'cd_form', 'sq_assessment', 'dt_last_update', 'tm_last_update',
+    'sat_load_dts', 'versionnumber'
+).where(
     col('cd_tax').isin([107, 170]) &
     (col('cd_asmt_status') != 11) &
     (col('dt_last_update') >= delta_start) & (col('dt_last_update') < delta_end) &
     (col('yr_form') <= current_year) & (col('yr_form') >= year_start)
-).withColumn(
-    'row_no',
-    row_number().over(Window.partitionBy('hub_id_forms').orderBy(
-        desc('tm_last_update'), desc('sat_load_dts'))
-    )
+).groupBy(
+    'hub_id_forms'
+).agg(
+    max(struct(
+        'dt_last_update',
+        'tm_last_update',
+        'sat_load_dts',
+        'sat_rec_src',
+        'dt_tax_pd_begin',
+        'dt_tax_pd_end',
+        'cd_update_source',
+        'cd_update_reason',
+        'id_updated_by',
+        'id_transaction',
+        'yr_form',
+        'id_rtn_seq',
+        'cd_asmt_status',
+        'dt_created',
+        'cd_form',
+        'cd_tax',
+        'sq_assessment',
+        'versionnumber'
+    )).alias('latest')
+).select(
+    'hub_id_forms',
+    'latest.*'
 ).filter(
-    'row_no = 1 AND sat_rec_src != "IRIN_DELETE"'
+    'sat_rec_src != "IRIN_DELETE"'
 )
 
 full_forms_hdr_df = sat_forms_hdr_df.alias('sat').join(
@@ -143,7 +186,9 @@ full_forms_hdr_df = sat_forms_hdr_df.alias('sat').join(
     'sat.versionnumber'
 )
 
-sat_forms_detail_df = spark.table('tax_dv.sat_forms_dtl_irin').withColumn(
+sat_forms_detail_df = spark.table('tax_dv.sat_forms_dtl_irin').select(
+    'hub_id_forms', 'sq_split', 'tx_line_items', 'versionnumber', 'sat_load_dts'
+).withColumn(
     'sq_split', expr("CASE WHEN sq_split = 0 OR sq_split > 3 THEN 4 ELSE sq_split END")
 ).filter(
     col('sq_split').isin([1, 2, 3, 4])
@@ -154,27 +199,49 @@ full_forms_df = full_forms_hdr_df.alias('hdr').join(
     'hub_id_forms',
     'inner'
 ).select(
-    'hdr.*',
+    # Only what the XML rebuild below uses; the wide header stays out of it.
+    'hdr.hub_id_forms',
     'hdr.id_internal',
+    'hdr.id_transaction',
+    'hdr.dt_tax_pd_begin',
     'dtl.sq_split',
     'dtl.tx_line_items',
     col('dtl.versionnumber').alias('dtl_vernum'),
     'dtl.sat_load_dts'
 )
 
-forms_splited_xml_df = full_forms_df.withColumn(
-    'row_no',
-    row_number().over(Window.partitionBy('hub_id_forms', 'sq_split').orderBy(desc('sat_load_dts'), desc('dtl_vernum')))
-).filter('row_no = 1')
-
-# Collect tx_line_items as an array ordered by sq_split ASC within the same hub_id_forms.
-# Then concat the list elements to one whole xml string.
-window = Window.partitionBy('hub_id_forms').orderBy('sq_split').rowsBetween(
-    Window.unboundedPreceding, Window.unboundedFollowing # IMPORTANT to make window work.
+forms_splited_xml_df = full_forms_df.groupBy(
+    'hub_id_forms', 'sq_split'
+).agg(
+    max(struct(
+        'sat_load_dts',
+        'dtl_vernum',
+        'id_internal',
+        'id_transaction',
+        'dt_tax_pd_begin',
+        'tx_line_items'
+    )).alias('latest')
+).select(
+    'hub_id_forms',
+    'sq_split',
+    'latest.*'
 )
-ca_form_df = forms_splited_xml_df.withColumn(
-    'whole_xml', concat_ws('', collect_list('tx_line_items').over(window))
-).filter('sq_split = 1').withColumn(
+
+# sq_split is always 1-4, so pivot the pieces of each form into columns '1'..'4'
+# (one hash aggregation) and concat them in sq_split order into one whole xml
+# string.  Only forms that have a first piece are kept; a present piece is
+# never null, so column '1' is null exactly when split 1 is missing.
+ca_form_df = forms_splited_xml_df.groupBy(
+    'hub_id_forms', 'id_internal', 'id_transaction', 'dt_tax_pd_begin'
+).pivot(
+    'sq_split', [1, 2, 3, 4]
+).agg(
+    first(coalesce('tx_line_items', lit('')))
+).filter(
+    col('1').isNotNull()
+).withColumn(
+    'whole_xml', concat_ws('', '1', '2', '3', '4')
+).withColumn(
     'whole_xml', regexp_replace('whole_xml', '\s+', '')  # Remove all whitespaces.
 )
 
@@ -183,6 +250,9 @@ ca_form_xml_tags = [
     ('GenericLessPrevAsst', 'am_prev_tax')
 ]
 
+# whole_xml is glued from up to four split pieces and need not be well-formed
+# XML, so tags are extracted by regex (a missing tag yields '') rather than
+# by an XML parser that would fail the job on a bad document.
 for (tag, col_name) in ca_form_xml_tags:
     pattern = '<' + tag + '>(.*?)</' + tag + '>'
     ca_form_df = ca_form_df.withColumn(col_name, regexp_extract('whole_xml', pattern, 1))
@@ -213,21 +283,26 @@ stg_net_tax_payable_ref_df = ca_form_df.select(
 #########################################################################################
 # Load entity
 #########################################################################################
-entity_window = Window.partitionBy('hub_id_entity').orderBy(desc('tm_last_update'), desc('sat_load_dts'))
-
-sat_entity_id = spark.table('tax_dv.sat_entity_id_irin').filter(
+sat_entity_id = spark.table('tax_dv.sat_entity_id_irin').select(
+    'hub_id_entity', 'in_primary_id', 'id_entity', 'dt_last_update', 'tm_last_update', 'sat_load_dts'
+).filter(
     col('in_primary_id') == 'Y'
-).withColumn(
-    'tm_last_update', last_update_tms
-).withColumn(
-    'row_no', row_number().over(entity_window)
-).filter('row_no = 1')
+).groupBy(
+    'hub_id_entity'
+).agg(
+    max(struct('dt_last_update', 'tm_last_update', 'sat_load_dts', 'id_entity')).alias('latest')
+).select('hub_id_entity', 'latest.*')
 
-sat_entity = spark.table('tax_dv.sat_entity_irin').withColumn(
-    'tm_last_update', last_update_tms
-).withColumn(
-    'row_no', row_number().over(entity_window)
-).filter('row_no = 1')
+sat_entity = spark.table('tax_dv.sat_entity_irin').select(
+    'hub_id_entity', 'cd_entity_class', 'in_record_type', 'cd_grade',
+    'dt_last_update', 'tm_last_update', 'sat_load_dts'
+).groupBy(
+    'hub_id_entity'
+).agg(
+    max(struct(
+        'dt_last_update', 'tm_last_update', 'sat_load_dts', 'cd_entity_class', 'in_record_type', 'cd_grade'
+    )).alias('latest')
+).select('hub_id_entity', 'latest.*')
 
 stg_entity_ref = spark.table('tax_dv.hub_entity').alias('hub').join(
     sat_entity.alias('sat_1'), 'hub_id_entity', 'inner'
@@ -244,14 +319,13 @@ stg_entity_ref = spark.table('tax_dv.hub_entity').alias('hub').join(
 #########################################################################################
 # Load stg_acct_notice_req_ref
 #########################################################################################
-sat_acct_notice_req_irin_df = spark.table('tax_dv.sat_acct_notice_req_irin').withColumn(
-    'tm_last_update', last_update_tms
-).withColumn(
-    'row_no',
-    row_number().over(Window.partitionBy('hub_id_acct_notice_req').orderBy(
-        desc('tm_last_update'), desc('sat_load_dts'))
-    )
-).filter('row_no = 1')
+sat_acct_notice_req_irin_df = spark.table('tax_dv.sat_acct_notice_req_irin').select(
+    'hub_id_acct_notice_req', 'cd_trans_status', 'dt_last_update', 'tm_last_update', 'sat_load_dts'
+).groupBy(
+    'hub_id_acct_notice_req'
+).agg(
+    max(struct('dt_last_update', 'tm_last_update', 'sat_load_dts', 'cd_trans_status')).alias('latest')
+).select('hub_id_acct_notice_req', 'latest.*')
 
 stg_acct_notice_req_ref = spark.table('tax_dv.hub_acct_notice_req').alias('hub').join(
     sat_acct_notice_req_irin_df.alias('sat'), 'hub_id_acct_notice_req', 'inner'
@@ -265,8 +339,11 @@ stg_acct_notice_req_ref = spark.table('tax_dv.hub_acct_notice_req').alias('hub')
 # Join together
 #########################################################################################
 
+# t2 only holds forms updated in this run's delta month, so it is broadcast and
+# the fact side keeps its partitioning.  t3/t4 cover the full entity and notice
+# history; their join strategy is left to the planner's size estimates.
 rpt_non_financials_df1 = stg_non_financials_df.alias('main').join(
-    stg_net_tax_payable_ref_df.alias('t2'),
+    broadcast(stg_net_tax_payable_ref_df).alias('t2'),
     ['id_transaction', 'id_internal', 'dt_tax_pd_begin'],
     'left'
 ).join(
@@ -287,15 +364,7 @@ rpt_non_financials_df1 = stg_non_financials_df.alias('main').join(
 #########################################################################################
 # Append extra columns and Persistence
 #########################################################################################
-final_df = rpt_non_financials_df1.withColumn(
-    "in_complete", lit("Y")
-).withColumn(
-    "type_of_fund", lit("Clubs & Associations")
-).withColumn(
-    'period_month', lit(dt_period_month)
-).withColumn(
-    "create_timestamp", current_timestamp()
-).select(
+final_df = rpt_non_financials_df1.select(
     'id_transaction',
     'id_internal',
     'dt_tax_pd_begin',
@@ -312,12 +381,13 @@ final_df = rpt_non_financials_df1.withColumn(
     'cd_grade',
     'id_entity',
     'cd_trans_status',
-    'in_complete',
-    'type_of_fund',
-    'period_month',
-    'create_timestamp'
+    lit("Y").alias("in_complete"),
+    lit("Clubs & Associations").alias("type_of_fund"),
+    lit(dt_period_month).alias('period_month'),
+    current_timestamp().alias("create_timestamp")
 )
 
 target = 'rpt_udp.rpt_non_financials'
-final_df.select(spark.table(target).columns).write.insertInto(target, overwrite=True)
+target_cols = spark.table(target).columns
+final_df.select(target_cols).write.insertInto(target, overwrite=True)
 
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""Shared layer-promotion backend for the lineage expansion scripts.
+
+:mod:`ExpandLayerDependencies` and :mod:`LayerToTargetExpander` both take a
+TableDependencyTracer CSV::
+
+    Target Table, Layer 1, Layer 2, ..., Source Table
+
+and promote every intermediate ``Layer N`` table that is not already a target
+into a row of its own, carrying over the downstream part of the chain.  They
+differ only in how the result is shaped, which :func:`expand` selects with two
+options:
+
+``group_by_target=True`` (ExpandLayerDependencies)
+    Rows are emitted grouped under their target table, existing targets
+    first.  Every distinct downstream chain of a layer is emitted, so callers
+    de-duplicate the output.  Empty layers are skipped when a chain is copied
+    and rows without a target are dropped.
+
+``group_by_target=False`` (LayerToTargetExpander)
+    Original rows stream through in input order and the promoted rows follow
+    them.  Each new target is promoted once, from the first chain it appears
+    in, cut at the first empty layer.
+
+``case_fold`` makes table names compare case-insensitively.  Rows are
+positional lists aligned with the CSV header throughout.
+"""
+
+from __future__ import annotations
+
+import csv
+import logging
+import multiprocessing
+import os
+import re
+import sys
+from dataclasses import dataclass
+from itertools import islice
+from operator import itemgetter
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Sequence, Set, TextIO, Tuple
+
+LOGGER = logging.getLogger(__name__)
+
+TARGET_COLUMN = "Target Table"
+SOURCE_COLUMN = "Source Table"
+_LAYER_PATTERN = re.compile(r"^Layer\s+(\d+)$")
+# Buffer size for streaming row I/O; the 8 KiB default means a syscall every few rows.
+_IO_BUFFER_SIZE = 1 << 20
+# Characters that force csv quoting; rows free of them (and of embedded commas) are joined directly.
+_NEEDS_QUOTING = re.compile(r'["\r\n]')
+# Rows per task when expansion runs in a process pool; large enough to amortise pickling.
+_CHUNK_SIZE = 10_000
+# Lines joined per handle.write call when emitting CSV rows.
+_WRITE_BATCH_SIZE = 4096
+
+
+def normalise_value(value: str | None) -> str:
+    """Return a stripped, interned string (``""`` for ``None``).
+
+    Interning makes every occurrence of a table name share one object, which
+    keeps the target sets and row groups small and lets lookups short-circuit
+    on identity.
+    """
+
+    if value is None:
+        return ""
+    return sys.intern(value.strip())
+
+
+class _FoldedKeys(dict):
+    """Cache of lower-cased keys, filled on first lookup of each value."""
+
+    def __missing__(self, value: str) -> str:
+        key = self[value] = value.lower()
+        return key
+
+
+def layer_columns(fieldnames: Sequence[str]) -> List[str]:
+    """Return layer columns sorted numerically (Layer 1, Layer 2, ...).
+
+    A ``Layer ...`` header without a number raises ``ValueError`` rather than
+    silently dropping that column's tables from the expansion.
+    """
+
+    layers = []
+    for name in fieldnames:
+        match = _LAYER_PATTERN.match(name)
+        if match:
+            layers.append((int(match.group(1)), name))
+        elif name.startswith("Layer "):
+            raise ValueError(f"Invalid layer column name: {name}")
+    layers.sort(key=lambda item: item[0])
+    return [name for _, name in layers]
+
+
+def collect_targets(
+    rows: Iterable[Sequence[str]],
+    fieldnames: Sequence[str],
+    *,
+    case_fold: bool = False,
+    target_column: str = TARGET_COLUMN,
+) -> Tuple[FrozenSet[str], int]:
+    """Return (non-empty target values, row count) from a single pass over ``rows``.
+
+    Targets are lower-cased when ``case_fold`` is set.  They are frozen
+    because expansion only ever tests membership.
+    """
+
+    if target_column not in fieldnames:
+        raise KeyError(f"Missing required column: {target_column}")
+    target_idx = list(fieldnames).index(target_column)
+
+    targets: Set[str] = set()
+    count = 0
+    for row in rows:
+        count += 1
+        target_value = normalise_value(row[target_idx])
+        if target_value:
+            targets.add(target_value.lower() if case_fold else target_value)
+    return frozenset(targets), count
+
+
+@dataclass(frozen=True)
+class _ExpansionPlan:
+    """Column positions and base targets needed to expand a row."""
+
+    target_idx: int
+    source_idx: int
+    layer_indices: Tuple[int, ...]
+    shift_indices: Tuple[int | None, ...]
+    shift_start: int | None  # set when Layer 1..n are adjacent columns
+    width: int
+    base_targets: FrozenSet[str]
+    case_fold: bool
+
+
+def _contiguous_start(indices: Sequence[int | None]) -> int | None:
+    """Return ``indices[0]`` when ``indices`` are consecutive positions, else ``None``."""
+
+    if not indices or indices[0] is None:
+        return None
+    start = indices[0]
+    return start if list(indices) == list(range(start, start + len(indices))) else None
+
+
+def _cells_getter(indices: Sequence[int]) -> Callable[[Sequence[str]], Tuple[str, ...]]:
+    """Return a callable that fetches the cells at ``indices`` from a row as a tuple."""
+
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda row: (row[index],)
+    return itemgetter(*indices)
+
+
+def _explode_rows(rows: Iterable[List[str]], plan: _ExpansionPlan) -> Iterator[Tuple[str, List[str]]]:
+    """Yield ``(group key, row)`` for each original row followed by its exploded rows."""
+
+    target_idx = plan.target_idx
+    source_idx = plan.source_idx
+    shift_indices = plan.shift_indices
+    shift_start = plan.shift_start
+    width = plan.width
+    base_targets = plan.base_targets
+    fold = _FoldedKeys().__getitem__ if plan.case_fold else None
+    get_layers = _cells_getter(plan.layer_indices)
+    # Checked once: even deferred-format debug calls cost a call per cell.
+    debug = LOGGER.isEnabledFor(logging.DEBUG)
+
+    for original in rows:
+        target_value = sys.intern(original[target_idx].strip())
+        if not target_value:
+            continue
+        yield (fold(target_value) if fold else target_value), original
+
+        # Empty layers are never promoted and are skipped in the copied tail,
+        # so only the populated, stripped layer values are kept.  Values are
+        # interned because they are copied into every exploded row.  The
+        # fetch/strip/filter/intern chain runs in C builtins, not per-cell bytecode.
+        chain = list(map(sys.intern, filter(None, map(str.strip, get_layers(original)))))
+        keys = list(map(fold, chain)) if fold else chain
+        if base_targets.issuperset(keys):
+            # Every layer is already a target: nothing to promote in this row.
+            continue
+        source_value = sys.intern(original[source_idx].strip())
+
+        for idx, layer_value in enumerate(chain):
+            if keys[idx] in base_targets:
+                if debug:
+                    LOGGER.debug("Skip layer '%s' because it already exists as a target", layer_value)
+                continue
+
+            new_row = [""] * width
+            new_row[target_idx] = layer_value
+            tail = chain[idx + 1 :]
+            if shift_start is not None:
+                new_row[shift_start : shift_start + len(tail)] = tail
+            else:
+                for shift_idx, tail_value in zip(shift_indices, tail):
+                    if shift_idx is not None:
+                        new_row[shift_idx] = tail_value
+            new_row[source_idx] = source_value
+
+            yield keys[idx], new_row
+            if debug:
+                LOGGER.debug("Added exploded row for layer '%s'", layer_value)
+
+
+_WORKER_PLAN: _ExpansionPlan | None = None
+
+
+def _init_worker(plan: _ExpansionPlan) -> None:
+    """Pool initializer: ship the expansion plan to each worker once."""
+
+    global _WORKER_PLAN
+    _WORKER_PLAN = plan
+
+
+def _explode_chunk(rows: List[List[str]]) -> List[Tuple[str, List[str]]]:
+    """Pool task: explode one chunk of rows with the worker's plan."""
+
+    assert _WORKER_PLAN is not None
+    return list(_explode_rows(rows, _WORKER_PLAN))
+
+
+def _explode_rows_parallel(
+    rows: Iterable[List[str]], plan: _ExpansionPlan, jobs: int
+) -> Iterator[Tuple[str, List[str]]]:
+    """Explode ``rows`` across ``jobs`` processes, preserving input order."""
+
+    row_iter = iter(rows)
+    chunks = iter(lambda: list(islice(row_iter, _CHUNK_SIZE)), [])
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(plan,)) as pool:
+        for keyed_rows in pool.imap(_explode_chunk, chunks):
+            yield from keyed_rows
+
+
+def _expand_grouped(rows: Iterable[List[str]], plan: _ExpansionPlan, jobs: int) -> Iterator[List[str]]:
+    """Yield exploded rows grouped by target, existing targets first."""
+
+    if jobs > 1:
+        keyed_rows = _explode_rows_parallel(rows, plan, jobs)
+    else:
+        keyed_rows = _explode_rows(rows, plan)
+
+    # One pass builds the insertion-ordered groups; the emit order is derived
+    # from their keys afterwards instead of tracking a separate ordered set.
+    grouped_rows: Dict[str, List[List[str]]] = {}
+    for target_key, row in keyed_rows:
+        group = grouped_rows.get(target_key)
+        if group is None:
+            grouped_rows[target_key] = [row]
+        else:
+            group.append(row)
+
+    base_targets = plan.base_targets
+    ordered_targets = [target for target in grouped_rows if target in base_targets]
+    ordered_targets.extend(target for target in grouped_rows if target not in base_targets)
+    for target in ordered_targets:
+        # Release each group once emitted so memory drains while writing.
+        yield from grouped_rows.pop(target)
+
+
+def _expand_streaming(rows: Iterable[List[str]], plan: _ExpansionPlan) -> Iterator[List[str]]:
+    """Yield original rows as read, then one promoted row per newly seen target."""
+
+    target_idx = plan.target_idx
+    source_idx = plan.source_idx
+    shift_indices = plan.shift_indices
+    shift_start = plan.shift_start
+    width = plan.width
+    seen_targets = set(plan.base_targets)
+    fold = _FoldedKeys().__getitem__ if plan.case_fold else None
+    get_layers = _cells_getter(plan.layer_indices)
+    promoted_rows: List[List[str]] = []
+    debug = LOGGER.isEnabledFor(logging.DEBUG)
+
+    for row in rows:
+        yield row
+
+        if not normalise_value(row[target_idx]):
+            if debug:
+                LOGGER.debug("Skipping row without target: %s", row)
+            continue
+
+        # Strip each layer cell once; the downstream chains below reuse these values.
+        # Fetch/strip/intern run in C builtins rather than per-cell bytecode.
+        layer_values = list(map(sys.intern, map(str.strip, get_layers(row))))
+        layer_keys = list(map(fold, layer_values)) if fold else layer_values
+        if seen_targets.issuperset(filter(None, layer_keys)):
+            continue
+        source_value = sys.intern(row[source_idx].strip())
+
+        for idx, layer_value in enumerate(layer_values):
+            if not layer_value:
+                continue
+
+            layer_key = layer_keys[idx]
+            if layer_key in seen_targets:
+                if debug:
+                    LOGGER.debug("Layer '%s' already present as target. Skipping expansion.", layer_value)
+                continue
+
+            # The chain runs up to (not including) the next empty layer.
+            downstream_chain = layer_values[idx + 1 :]
+            if "" in downstream_chain:
+                del downstream_chain[downstream_chain.index("") :]
+
+            new_row = [""] * width
+            new_row[target_idx] = layer_value
+            if shift_start is not None:
+                new_row[shift_start : shift_start + len(downstream_chain)] = downstream_chain
+            else:
+                # Depth beyond the header's Layer columns has nowhere to go and is dropped.
+                for shift_idx, chain_value in zip(shift_indices, downstream_chain):
+                    if shift_idx is not None:
+                        new_row[shift_idx] = chain_value
+            new_row[source_idx] = source_value
+
+            if debug:
+                LOGGER.debug(
+                    "Promoted layer '%s' to target with %d downstream layer(s).",
+                    layer_value,
+                    len(downstream_chain),
+                )
+            promoted_rows.append(new_row)
+            seen_targets.add(layer_key)
+
+    yield from promoted_rows
+
+
+def expand(
+    rows: Iterable[List[str]],
+    fieldnames: Sequence[str],
+    *,
+    case_fold: bool,
+    group_by_target: bool,
+    known_targets: FrozenSet[str] | None = None,
+    jobs: int = 1,
+    target_column: str = TARGET_COLUMN,
+    source_column: str = SOURCE_COLUMN,
+) -> Iterator[List[str]]:
+    """Return ``rows`` plus a promoted row for each intermediate layer table.
+
+    See the module docstring for what ``case_fold`` and ``group_by_target``
+    select.  ``known_targets`` is the set of every target in the input, as
+    returned by :func:`collect_targets` with the same ``case_fold``.  When it
+    is supplied ``rows`` is consumed exactly once, so it may be a streaming
+    iterator.  ``jobs > 1`` explodes grouped rows in a process pool with the
+    same output order; streaming expansion is inherently sequential.
+
+    The columns are checked here, before any row is produced, so a bad
+    header fails before the caller starts writing output.
+    """
+
+    column_index = {name: idx for idx, name in enumerate(fieldnames)}
+    if target_column not in column_index:
+        raise KeyError(f"Missing required column: {target_column}")
+    if source_column not in column_index:
+        raise KeyError(f"Missing required column: {source_column}")
+
+    layers = layer_columns(fieldnames)
+    if not layers:
+        LOGGER.info("No layer columns found. Nothing to expand.")
+        return iter(rows)
+    LOGGER.debug("Detected layer columns: %s", ", ".join(layers))
+
+    if known_targets is None:
+        rows = list(rows)
+        known_targets, _ = collect_targets(
+            rows, fieldnames, case_fold=case_fold, target_column=target_column
+        )
+
+    # Resolve every column position once so the row loop only does list indexing.
+    shift_indices = tuple(column_index.get(f"Layer {n}") for n in range(1, len(layers) + 1))
+    plan = _ExpansionPlan(
+        target_idx=column_index[target_column],
+        source_idx=column_index[source_column],
+        layer_indices=tuple(column_index[name] for name in layers),
+        shift_indices=shift_indices,
+        shift_start=_contiguous_start(shift_indices),
+        width=len(fieldnames),
+        base_targets=frozenset(known_targets),
+        case_fold=case_fold,
+    )
+    if group_by_target:
+        return _expand_grouped(rows, plan, jobs)
+    return _expand_streaming(rows, plan)
+
+
+def iter_csv_rows(path: str | os.PathLike[str], width: int, *, encoding: str = "utf-8") -> Iterator[List[str]]:
+    """Yield the data rows of ``path`` (header skipped) as ``width``-cell lists.
+
+    Blank lines are skipped; short rows are padded with ``""`` and surplus
+    cells are dropped.
+    """
+
+    with open(path, "r", buffering=_IO_BUFFER_SIZE, newline="", encoding=encoding) as handle:
+        reader = csv.reader(handle)
+        next(reader, None)
+        for row in reader:
+            if row:
+                yield _fit_row(row, width)
+
+
+def _fit_row(row: List[str], width: int) -> List[str]:
+    """Pad or truncate ``row`` in place so it has exactly ``width`` cells."""
+
+    if len(row) < width:
+        row.extend([""] * (width - len(row)))
+    elif len(row) > width:
+        del row[width:]
+    return row
+
+
+def write_csv(path: str | os.PathLike[str], rows: Iterable[Sequence[str]], fieldnames: Sequence[str]) -> int:
+    """Write ``fieldnames`` and positional ``rows`` to ``path``; return the data row count."""
+
+    with open(path, "w", buffering=_IO_BUFFER_SIZE, newline="", encoding="utf-8") as handle:
+        csv.writer(handle).writerow(fieldnames)
+        return _emit_rows(handle, rows)
+
+
+def _emit_rows(handle: TextIO, rows: Iterable[Sequence[str]]) -> int:
+    """Write ``rows`` to ``handle`` as CSV and return how many were written.
+
+    Rows whose cells hold no quotes, line breaks or embedded commas -- the
+    usual ``schema.table`` lineage row -- are joined directly instead of going
+    through the csv module's per-field quoting logic, and are written in
+    batches of ``_WRITE_BATCH_SIZE`` lines with a single ``write`` call.
+    Anything else falls back to :class:`csv.writer`, so the output is
+    byte-identical either way.
+    """
+
+    writer = csv.writer(handle)
+    terminator = writer.dialect.lineterminator
+    write = handle.write
+    batch: List[str] = []
+    count = 0
+    for row in rows:
+        line = ",".join(row)
+        if len(row) > 1 and line.count(",") == len(row) - 1 and not _NEEDS_QUOTING.search(line):
+            batch.append(line)
+            if len(batch) >= _WRITE_BATCH_SIZE:
+                write(terminator.join(batch) + terminator)
+                batch.clear()
+        else:
+            if batch:
+                write(terminator.join(batch) + terminator)
+                batch.clear()
+            writer.writerow(row)
+        count += 1
+    if batch:
+        write(terminator.join(batch) + terminator)
+    return count